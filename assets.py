@@ -0,0 +1,104 @@
+import argparse
+import json
+import mmap
+import os
+import struct
+
+from PIL import Image
+
+from consts import ASSET_BUNDLE, ASSET_VARIANTS
+
+BUNDLE_MAGIC = b'SPRB'
+BUNDLE_VERSION = 1
+HEADER = struct.Struct('<4sII')
+ALIGNMENT = 16
+
+
+def bundle_key(filename, size):
+    if size is None:
+        return filename
+    return '%s@%dx%d' % (filename, size[0], size[1])
+
+
+def image_files(images_dir):
+    files = []
+    for root, dirs, names in os.walk(images_dir):
+        dirs.sort()
+        for name in sorted(names):
+            if name.lower().endswith('.png'):
+                files.append(os.path.join(root, name).replace(os.sep, '/'))
+    return files
+
+
+def build_bundle(images_dir='images', output=ASSET_BUNDLE, variants=ASSET_VARIANTS):
+    entries = [(filename, None) for filename in image_files(images_dir)]
+    entries.extend((filename, tuple(size)) for filename, size in variants)
+
+    sources = {}
+    index = {}
+    blobs = []
+    offset = 0
+    for filename, size in entries:
+        image = sources.get(filename)
+        if image is None:
+            image = sources[filename] = Image.open(filename).convert("RGBA")
+        if size is not None:
+            image = image.resize(size)
+        data = image.tobytes()
+        index[bundle_key(filename, size)] = [offset, image.width, image.height]
+        padding = -len(data) % ALIGNMENT
+        blobs.append(data + b'\0' * padding)
+        offset += len(data) + padding
+
+    index_data = json.dumps(index).encode()
+    index_data += b' ' * (-(HEADER.size + len(index_data)) % ALIGNMENT)
+    with open(output, 'wb') as f:
+        f.write(HEADER.pack(BUNDLE_MAGIC, BUNDLE_VERSION, len(index_data)))
+        f.write(index_data)
+        for blob in blobs:
+            f.write(blob)
+    return len(index)
+
+
+class AssetBundle:
+    def __init__(self, path=ASSET_BUNDLE):
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, index_size = HEADER.unpack_from(self.data)
+        if magic != BUNDLE_MAGIC or version != BUNDLE_VERSION:
+            raise ValueError("%s is not a version %d asset bundle" % (path, BUNDLE_VERSION))
+        start = HEADER.size
+        self.index = json.loads(bytes(self.data[start:start + index_size]))
+        self.base = start + index_size
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def get(self, filename, size=None):
+        entry = self.index.get(bundle_key(filename, size))
+        if entry is None:
+            return None
+        offset, width, height = entry
+        start = self.base + offset
+        view = memoryview(self.data)[start:start + width * height * 4]
+        return Image.frombuffer('RGBA', (width, height), view, 'raw', 'RGBA', 0, 1)
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+
+def load_bundle(path=ASSET_BUNDLE):
+    if not os.path.exists(path):
+        return None
+    return AssetBundle(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compile images/ into an asset bundle")
+    parser.add_argument('--images', default='images')
+    parser.add_argument('--output', default=ASSET_BUNDLE)
+    args = parser.parse_args()
+    count = build_bundle(args.images, args.output)
+    print("wrote %d images to %s (%d KiB)" % (
+        count, args.output, os.path.getsize(args.output) // 1024))
@@ -0,0 +1,267 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from consts import *
+from main import SpaceGame
+from perf import percentile
+from replay import KeyEvent
+from utils import seed_rng
+
+# upper bucket edges for per-tick cost, in microseconds
+COST_BUCKETS = (25, 50, 100, 200, 400, 800, 1600, 3200, 6400, 12800, float('inf'))
+# JSON has no infinity, so the overflow bucket is reported by its lower edge
+BUCKET_NAMES = tuple(str(edge) for edge in COST_BUCKETS[:-1]) + ('>%d' % COST_BUCKETS[-2],)
+CURVE_STEP = 100
+
+
+class IdleBot:
+    def __init__(self, seed):
+        pass
+
+    def act(self, game):
+        pass
+
+
+class CircleBot(IdleBot):
+    def act(self, game):
+        if game.tick == 1:
+            press(game, 'Left')
+            press(game, 'space', ' ')
+        if game.bomb_power.value == BOMB_FULL_POWER and game.enemies:
+            press(game, 'z', 'z')
+            release(game, 'z', 'z')
+
+
+class RandomBot(IdleBot):
+    KEYS = (('Left', ''), ('Right', ''), ('space', ' '), ('x', 'x'), ('z', 'z'))
+
+    def __init__(self, seed):
+        self.rng = random.Random(seed)
+        self.held = set()
+
+    def act(self, game):
+        rng = self.rng
+        if rng.random() < 0.2:
+            key = rng.choice(self.KEYS)
+            if key in self.held:
+                self.held.discard(key)
+                release(game, *key)
+            else:
+                self.held.add(key)
+                press(game, *key)
+
+
+class BatchGame(SpaceGame):
+    def init_game(self):
+        super().init_game()
+        self.bot = None
+
+    def pre_update(self):
+        if self.bot is not None:
+            self.bot.act(self)
+        super().pre_update()
+
+
+BOTS = {
+    'idle': IdleBot,
+    'circle': CircleBot,
+    'random': RandomBot,
+}
+
+
+def press(game, keysym, char=''):
+    game.key_pressed_handler.handle(KeyEvent(keysym, char))
+
+
+def release(game, keysym, char=''):
+    game.key_released_handler.handle(KeyEvent(keysym, char))
+
+
+def quiet_worker():
+    sys.stdout = open(os.devnull, 'w')
+
+
+def play_session(config):
+    seed_rng(config['seed'])
+    game = BatchGame(None, CANVAS_WIDTH, CANVAS_HEIGHT, UPDATE_DELAY, headless=True)
+    game.bot = BOTS[config['bot']](config['seed'])
+    if config.get('probs'):
+        for strategy, prob in zip(game.enemy_creation_strategies, config['probs']):
+            strategy[0] = prob
+    if config.get('levels'):
+        game.levels = config['levels']
+    if config.get('boss_score') is not None:
+        game.boss_score = config['boss_score']
+
+    ticks = config['ticks']
+    costs = [0] * len(COST_BUCKETS)
+    curve = []
+    peaks = {'enemies': 0, 'bullets': 0, 'explosions': 0}
+    game.start()
+    while game.tick < ticks and not game.is_stopped:
+        start = time.perf_counter()
+        if not game.clock.run_next():
+            break
+        cost = (time.perf_counter() - start) * 1e6
+        for index, edge in enumerate(COST_BUCKETS):
+            if cost <= edge:
+                costs[index] += 1
+                break
+
+        peaks['enemies'] = max(peaks['enemies'], len(game.enemies))
+        peaks['bullets'] = max(peaks['bullets'], len(game.bullets))
+        peaks['explosions'] = max(peaks['explosions'], game.explosions.count())
+        if game.tick % CURVE_STEP == 0:
+            curve.append(game.score.value)
+
+    return {
+        'seed': config['seed'],
+        'bot': config['bot'],
+        'survived': game.tick,
+        'died': game.is_stopped,
+        'score': game.score.value,
+        'level': game.level.value,
+        'boss': game.boss is not None,
+        'curve': curve,
+        'peaks': peaks,
+        'costs': costs,
+    }
+
+
+def histogram_percentile(counts, p):
+    total = sum(counts)
+    if not total:
+        return 0
+    target = total * p
+    seen = 0
+    for edge, name, count in zip(COST_BUCKETS, BUCKET_NAMES, counts):
+        seen += count
+        if seen >= target:
+            return edge if edge != COST_BUCKETS[-1] else name
+    return BUCKET_NAMES[-1]
+
+
+def summarize(values):
+    if not values:
+        return {}
+    return {
+        'mean': sum(values) / len(values),
+        'p50': percentile(values, 0.5),
+        'p95': percentile(values, 0.95),
+        'min': min(values),
+        'max': max(values),
+    }
+
+
+def mean_curve(curves, length):
+    # a session that ended early keeps its final score for the rest of the curve
+    totals = [0] * length
+    for curve in curves:
+        last = 0
+        for index in range(length):
+            if index < len(curve):
+                last = curve[index]
+            totals[index] += last
+    return [total / len(curves) for total in totals]
+
+
+def aggregate(results, ticks):
+    report = {}
+    for bot in sorted({r['bot'] for r in results}):
+        sessions = [r for r in results if r['bot'] == bot]
+        costs = [sum(column) for column in zip(*(r['costs'] for r in sessions))]
+        report[bot] = {
+            'sessions': len(sessions),
+            'died': sum(r['died'] for r in sessions) / len(sessions),
+            'reached_boss': sum(r['boss'] for r in sessions) / len(sessions),
+            'survived_ticks': summarize([r['survived'] for r in sessions]),
+            'score': summarize([r['score'] for r in sessions]),
+            'level': summarize([r['level'] for r in sessions]),
+            'score_curve': mean_curve([r['curve'] for r in sessions], ticks // CURVE_STEP),
+            'peaks': {name: summarize([r['peaks'][name] for r in sessions])
+                      for name in ('enemies', 'bullets', 'explosions')},
+            'tick_cost_us': {
+                'p50': histogram_percentile(costs, 0.5),
+                'p95': histogram_percentile(costs, 0.95),
+                'p99': histogram_percentile(costs, 0.99),
+                'buckets': dict(zip(BUCKET_NAMES, costs)),
+            },
+        }
+    return report
+
+
+def parse_floats(text):
+    return [float(value) for value in text.split(',')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play many seeded sessions with bots")
+    parser.add_argument('--sessions', type=int, default=100,
+                        help="sessions per bot")
+    parser.add_argument('--ticks', type=int, default=5000,
+                        help="tick limit per session")
+    parser.add_argument('--bots', default='random,circle',
+                        help="comma separated bots: %s" % ', '.join(BOTS))
+    parser.add_argument('--seed', type=int, default=1, help="first session seed")
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--probs', type=parse_floats,
+                        help="starting tie fighter, star, edge strategy probabilities")
+    parser.add_argument('--levels', help="JSON list of [score, level, {strategy: prob}]")
+    parser.add_argument('--boss-score', type=int)
+    parser.add_argument('--output', default='batch.json')
+    args = parser.parse_args()
+
+    levels = None
+    if args.levels:
+        levels = [(score, level, {int(k): v for k, v in probs.items()})
+                  for score, level, probs in json.loads(args.levels)]
+
+    configs = []
+    for bot in args.bots.split(','):
+        if bot not in BOTS:
+            parser.error("unknown bot: %s" % bot)
+        for seed in range(args.seed, args.seed + args.sessions):
+            configs.append({'seed': seed, 'bot': bot, 'ticks': args.ticks,
+                            'probs': args.probs, 'levels': levels,
+                            'boss_score': args.boss_score})
+
+    start = time.perf_counter()
+    chunksize = max(1, len(configs) // (args.workers * 8))
+    with ProcessPoolExecutor(args.workers, initializer=quiet_worker) as executor:
+        results = list(executor.map(play_session, configs, chunksize=chunksize))
+    elapsed = time.perf_counter() - start
+
+    total_ticks = sum(r['survived'] for r in results)
+    report = {
+        'sessions': len(results),
+        'workers': args.workers,
+        'ticks': args.ticks,
+        'seed': args.seed,
+        'probs': args.probs or list(ENEMY_STRATEGY_PROBS),
+        'levels': levels or LEVELS,
+        'boss_score': args.boss_score if args.boss_score is not None else BOSS_SCORE,
+        'elapsed': elapsed,
+        'simulated_ticks': total_ticks,
+        'bots': aggregate(results, args.ticks),
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2, allow_nan=False)
+
+    print("%d sessions, %d ticks in %.1fs (%.0f ticks/s, %.1f game hours)" % (
+        len(results), total_ticks, elapsed, total_ticks / elapsed if elapsed else 0,
+        total_ticks * UPDATE_DELAY / 3600000))
+    for bot, summary in report['bots'].items():
+        print("%-8s died %3.0f%%  survived p50 %6d  score mean %6.1f  p95 %4d  "
+              "peak enemies %3d  tick p95 %s us" % (
+                  bot, summary['died'] * 100, summary['survived_ticks']['p50'],
+                  summary['score']['mean'], summary['score']['p95'],
+                  summary['peaks']['enemies']['max'], summary['tick_cost_us']['p95']))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+import argparse
+import gc
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from consts import *
+from gamelib import sprite_cache
+from main import SpaceGame
+from perf import percentile
+from utils import seed_rng
+
+
+class BenchGame(SpaceGame):
+    def init_game(self):
+        super().init_game()
+        self.deaths = 0
+        self.strategy_override = None
+        self.tick_hooks = []
+
+    def stop_animation(self):
+        # keep the scenario running through ship deaths
+        self.deaths += 1
+        self.health.value = 4
+
+    def level_stage(self):
+        if self.strategy_override is None:
+            super().level_stage()
+            return
+        for strategy, prob in zip(self.enemy_creation_strategies, self.strategy_override):
+            strategy[0] = prob
+
+    def pre_update(self):
+        for hook in self.tick_hooks:
+            hook(self)
+        super().pre_update()
+
+
+def circle_and_fire(game):
+    game.ship.start_turn('LEFT')
+    if game.tick % 5 == 0:
+        game.ship.fire()
+
+
+def bomb_every_20_ticks(game):
+    if game.tick % 20 == 0:
+        game.bomb_power.value = BOMB_FULL_POWER
+        game.bomb()
+
+
+def setup_edge_stream(game):
+    game.strategy_override = (0, 0, 1)
+
+
+def setup_star_bursts(game):
+    game.strategy_override = (0, 1, 0)
+
+
+def setup_tie_fighters(game):
+    game.score.value = 300
+    game.strategy_override = (1, 0, 0)
+
+
+def setup_deathstar(game):
+    game.score.value = 400
+
+
+def setup_bomb_spam(game):
+    game.strategy_override = (0.09, 0.03, 1)
+    game.tick_hooks.append(bomb_every_20_ticks)
+
+
+SCENARIOS = {
+    'edge_stream': setup_edge_stream,
+    'star_bursts': setup_star_bursts,
+    'tie_fighters': setup_tie_fighters,
+    'deathstar': setup_deathstar,
+    'bomb_spam': setup_bomb_spam,
+}
+
+
+def make_game(name, seed):
+    seed_rng(seed)
+    sprite_cache.clear()
+    game = BenchGame(None, CANVAS_WIDTH, CANVAS_HEIGHT, UPDATE_DELAY, headless=True)
+    game.tick_hooks.append(circle_and_fire)
+    SCENARIOS[name](game)
+    return game
+
+
+def run_frames(game, ticks):
+    frame_times = []
+    game.start()
+    while game.tick < ticks:
+        start = time.perf_counter()
+        if not game.clock.run_next():
+            break
+        frame_times.append(time.perf_counter() - start)
+    return frame_times
+
+
+def run_scenario(name, ticks, seed):
+    game = make_game(name, seed)
+    gc.collect()
+    start = time.perf_counter()
+    frame_times = run_frames(game, ticks)
+    elapsed = time.perf_counter() - start
+
+    result = {
+        'ticks': len(frame_times),
+        'ticks_per_sec': len(frame_times) / elapsed if elapsed else 0,
+        'frame_ms_p50': percentile(frame_times, 0.5) * 1000,
+        'frame_ms_p95': percentile(frame_times, 0.95) * 1000,
+        'frame_ms_p99': percentile(frame_times, 0.99) * 1000,
+        'frame_ms_max': max(frame_times) * 1000 if frame_times else 0,
+        'score': game.score.value,
+        'deaths': game.deaths,
+        'sprite_cache_misses': sprite_cache.misses,
+        'sprite_cache_hits': sprite_cache.hits,
+    }
+
+    game = make_game(name, seed)
+    gc.collect()
+    blocks_before = sys.getallocatedblocks()
+    tracemalloc.start()
+    run_frames(game, ticks)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    gc.collect()
+    result['net_allocated_blocks'] = sys.getallocatedblocks() - blocks_before
+    result['traced_bytes_end'] = current
+    result['traced_bytes_peak'] = peak
+    return result
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                              capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ''
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, result in results['scenarios'].items():
+        old = baseline.get('scenarios', {}).get(name)
+        if old is None:
+            continue
+        for key, higher_is_better in (('ticks_per_sec', True),
+                                      ('frame_ms_p95', False),
+                                      ('traced_bytes_peak', False)):
+            if not old.get(key):
+                continue
+            change = (result[key] - old[key]) / old[key]
+            worse = -change if higher_is_better else change
+            flag = ''
+            if worse > tolerance:
+                flag = '  REGRESSION'
+                regressions.append((name, key))
+            print("%-14s %-18s %12.2f -> %12.2f  %+6.1f%%%s" %
+                  (name, key, old[key], result[key], change * 100, flag))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Space Fighter benchmarks")
+    parser.add_argument('scenarios', nargs='*', default=list(SCENARIOS),
+                        help="scenarios to run (default: all)")
+    parser.add_argument('--ticks', type=int, default=3000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', default='bench.json')
+    parser.add_argument('--compare', help="baseline JSON file to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.10,
+                        help="relative slowdown reported as a regression")
+    args = parser.parse_args()
+
+    results = {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'ticks': args.ticks,
+        'seed': args.seed,
+        'scenarios': {},
+    }
+    for name in args.scenarios:
+        result = run_scenario(name, args.ticks, args.seed)
+        results['scenarios'][name] = result
+        print("%-14s %8.0f ticks/s  p50 %.2f  p95 %.2f  max %.2f ms  peak %d KiB" % (
+            name, result['ticks_per_sec'], result['frame_ms_p50'],
+            result['frame_ms_p95'], result['frame_ms_max'],
+            result['traced_bytes_peak'] // 1024))
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+import argparse
+import sys
+import time
+from collections import OrderedDict
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from PIL import Image, ImageDraw, ImageTk
+
+from consts import *
+from headless import NullCanvas
+
+
+def tk_round(value):
+    # Tk rounds image coordinates half away from zero before anchoring
+    return int(value + 0.5) if value >= 0 else int(value - 0.5)
+
+
+def image_origin(x, y, width, height):
+    return tk_round(x) - width // 2, tk_round(y) - height // 2
+
+
+def parse_color(color):
+    color = color.lstrip('#')
+    step = len(color) // 3
+    scale = 255 // (16 ** step - 1)
+    return tuple(int(color[i * step:(i + 1) * step], 16) * scale for i in range(3))
+
+
+class SpriteArray:
+    __slots__ = ('source', 'width', 'height', 'dx', 'dy', 'premultiplied', 'inverse_alpha',
+                 'rgb', 'opaque')
+
+    def __init__(self, source):
+        # holding the source keeps its id from being reused while cached
+        self.source = source
+        image = source if source.mode == 'RGBA' else source.convert('RGBA')
+        self.width, self.height = image.size
+        pixels = np.asarray(image)
+
+        # keep only the visible part; rotated sprites are mostly transparent
+        ys, xs = np.nonzero(pixels[..., 3])
+        if len(xs):
+            x0, x1, y0, y1 = xs.min(), xs.max() + 1, ys.min(), ys.max() + 1
+        else:
+            x0 = x1 = y0 = y1 = 0
+        self.dx = x0
+        self.dy = y0
+        pixels = pixels[y0:y1, x0:x1]
+
+        alpha = pixels[..., 3:4].astype(np.uint16)
+        self.rgb = np.ascontiguousarray(pixels[..., :3])
+        self.premultiplied = self.rgb * alpha
+        self.inverse_alpha = 255 - alpha
+        self.opaque = bool((alpha == 255).all())
+
+
+class CompositingCanvas(NullCanvas):
+    def __init__(self, width, height, target=None):
+        if np is None:
+            raise RuntimeError("the composite backend requires numpy")
+        super().__init__(width, height)
+        self.frame = np.zeros((height, width, 3), dtype=np.uint8)
+        self.sprites = OrderedDict()
+        self.blits = 0
+
+        # text stays a real canvas item above the composited frame
+        self.target = target
+        self.text_items = {}
+        self.photo = None
+        if target is not None:
+            self.photo = ImageTk.PhotoImage('RGB', (width, height))
+            self.frame_item = target.create_image(0, 0, image=self.photo, anchor='nw')
+
+    def grid(self, **options):
+        if self.target is not None:
+            self.target.grid(**options)
+
+    def create_text(self, *coords, **options):
+        item = super().create_text(*coords, **options)
+        if self.target is not None:
+            self.text_items[item] = self.target.create_text(*coords, **options)
+        return item
+
+    def coords(self, item, *coords):
+        result = super().coords(item, *coords)
+        if coords and item in self.text_items:
+            self.target.coords(self.text_items[item], *coords)
+        return result
+
+    def move(self, item, dx, dy):
+        super().move(item, dx, dy)
+        if item in self.text_items:
+            self.target.move(self.text_items[item], dx, dy)
+
+    def itemconfigure(self, item, **options):
+        super().itemconfigure(item, **options)
+        if item in self.text_items:
+            self.target.itemconfigure(self.text_items[item], **options)
+
+    itemconfig = itemconfigure
+
+    def delete(self, item):
+        super().delete(item)
+        text_item = self.text_items.pop(item, None)
+        if text_item is not None:
+            self.target.delete(text_item)
+
+    def apply_batch(self, moves, options, raised):
+        super().apply_batch(moves, options, raised)
+        for item, item_options in options.items():
+            if item in self.text_items:
+                self.target.itemconfigure(self.text_items[item], **item_options)
+        for item, (x, y) in moves.items():
+            if item in self.text_items:
+                self.target.coords(self.text_items[item], x, y)
+
+    def sprite(self, image):
+        key = id(image)
+        sprite = self.sprites.get(key)
+        if sprite is not None:
+            self.sprites.move_to_end(key)
+            return sprite
+        sprite = SpriteArray(image)
+        self.sprites[key] = sprite
+        if len(self.sprites) > SPRITE_CACHE_SIZE:
+            self.sprites.popitem(last=False)
+        return sprite
+
+    def blit(self, sprite, x, y):
+        left, top = image_origin(x, y, sprite.width, sprite.height)
+        left += sprite.dx
+        top += sprite.dy
+        height, width = sprite.rgb.shape[:2]
+        x0 = max(left, 0)
+        y0 = max(top, 0)
+        x1 = min(left + width, self.width)
+        y1 = min(top + height, self.height)
+        if x0 >= x1 or y0 >= y1:
+            return
+
+        self.blits += 1
+        src = (slice(y0 - top, y1 - top), slice(x0 - left, x1 - left))
+        dst = self.frame[y0:y1, x0:x1]
+        if sprite.opaque:
+            dst[...] = sprite.rgb[src]
+            return
+        # (src * a + dst * (255 - a)) / 255, rounded, without a division
+        blended = dst * sprite.inverse_alpha[src]
+        blended += sprite.premultiplied[src]
+        blended += 128
+        blended += blended >> 8
+        blended >>= 8
+        dst[...] = blended
+
+    def fill_oval(self, coords, options):
+        x0, y0, x1, y1 = coords
+        left = int(min(x0, x1))
+        top = int(min(y0, y1))
+        width = int(max(x0, x1)) - left + 2
+        height = int(max(y0, y1)) - top + 2
+
+        # rasterize the ring once as a small mask: 1 fill, 2 outline
+        mask = Image.new('L', (width, height))
+        ImageDraw.Draw(mask).ellipse((x0 - left, y0 - top, x1 - left, y1 - top),
+                                     fill=1 if options.get('fill') else None, outline=2)
+        mask = np.asarray(mask)
+
+        cx0 = max(left, 0)
+        cy0 = max(top, 0)
+        cx1 = min(left + width, self.width)
+        cy1 = min(top + height, self.height)
+        if cx0 >= cx1 or cy0 >= cy1:
+            return
+        mask = mask[cy0 - top:cy1 - top, cx0 - left:cx1 - left]
+        dst = self.frame[cy0:cy1, cx0:cx1]
+        if options.get('fill'):
+            dst[mask == 1] = parse_color(options['fill'])
+        dst[mask == 2] = parse_color(options.get('outline', '#000000'))
+
+    def compose(self):
+        self.blits = 0
+        self.frame.fill(0)
+        for kind, coords, options in self.items.values():
+            if options.get('state') == 'hidden':
+                continue
+            if kind == 'image':
+                image = options.get('image')
+                if image is not None:
+                    self.blit(self.sprite(image), coords[0], coords[1])
+            elif kind == 'oval':
+                self.fill_oval(coords, options)
+        return self.frame
+
+    def present(self):
+        frame = self.compose()
+        if self.photo is not None:
+            self.photo.paste(Image.frombuffer(
+                'RGB', (self.width, self.height), frame, 'raw', 'RGB', 0, 1))
+
+
+def reference_frame(canvas):
+    # what the per-item canvas draws: every visible item composited in
+    # stacking order, one PIL operation per item
+    frame = Image.new('RGBA', (canvas.width, canvas.height), (0, 0, 0, 255))
+    draw = ImageDraw.Draw(frame)
+    for kind, coords, options in canvas.items.values():
+        if options.get('state') == 'hidden':
+            continue
+        if kind == 'image' and options.get('image') is not None:
+            image = options['image']
+            if image.mode != 'RGBA':
+                image = image.convert('RGBA')
+            left, top = image_origin(coords[0], coords[1], *image.size)
+            box = (max(-left, 0), max(-top, 0),
+                   min(image.width, canvas.width - left), min(image.height, canvas.height - top))
+            if box[0] < box[2] and box[1] < box[3]:
+                frame.alpha_composite(image, (max(left, 0), max(top, 0)), box)
+        elif kind == 'oval':
+            draw.ellipse(coords, fill=options.get('fill'),
+                         outline=options.get('outline', '#000000'))
+    return np.asarray(frame)
+
+
+def new_game(seed):
+    from batch import BatchGame, CircleBot
+    from utils import seed_rng
+
+    # the circling bot fires and bombs, so sprites, rotations and bomb
+    # rings all end up in the compared frames
+    seed_rng(seed)
+    game = BatchGame(None, CANVAS_WIDTH, CANVAS_HEIGHT, UPDATE_DELAY, headless=True,
+                     backend='composite')
+    game.bot = CircleBot(seed)
+    game.start()
+    return game
+
+
+def check(ticks, seed, every, tolerance):
+    game = new_game(seed)
+    sessions = 1
+    ovals = 0
+    composite_times = []
+    reference_times = []
+    worst = 0
+    worst_fraction = 0
+    frames = 0
+    # the bot dies well before most tick counts, so keep playing fresh
+    # seeded sessions until the whole budget has been compared
+    tick = 0
+    while tick < ticks:
+        if game.is_stopped:
+            seed += 1
+            sessions += 1
+            game = new_game(seed)
+        game.clock.run_next()
+        tick += 1
+        if tick % every:
+            continue
+        start = time.perf_counter()
+        ovals += sum(entry[0] == 'oval' for entry in game.canvas.items.values())
+        frame = game.canvas.compose().astype(np.int16)
+        composite_times.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        reference = reference_frame(game.canvas)[..., :3].astype(np.int16)
+        reference_times.append(time.perf_counter() - start)
+
+        diff = np.abs(frame - reference).max(axis=2)
+        worst = max(worst, int(diff.max()))
+        worst_fraction = max(worst_fraction, float((diff > tolerance).mean()))
+        frames += 1
+
+    composite_ms = sum(composite_times) / len(composite_times) * 1000
+    reference_ms = sum(reference_times) / len(reference_times) * 1000
+    print("%d frames compared over %d ticks in %d sessions, %d bomb rings drawn" % (
+        frames, tick, sessions, ovals))
+    print("composite %.2f ms/frame, per-item reference %.2f ms/frame (%.1fx)" % (
+        composite_ms, reference_ms, reference_ms / composite_ms if composite_ms else 0))
+    print("max channel difference %d, worst frame has %.4f%% pixels off by more than %d" % (
+        worst, worst_fraction * 100, tolerance))
+    expected = ticks // every
+    if frames < expected:
+        print("only %d of %d expected frames were compared" % (frames, expected))
+        return False
+    return worst_fraction < 0.001
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the composite backend with per-item canvas drawing")
+    parser.add_argument('--ticks', type=int, default=900)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--every', type=int, default=10, help="compare every Nth tick")
+    parser.add_argument('--tolerance', type=int, default=2,
+                        help="per-channel difference allowed for rounding")
+    args = parser.parse_args()
+    sys.exit(0 if check(args.ticks, args.seed, args.every, args.tolerance) else 1)
+
+
+if __name__ == "__main__":
+    main()
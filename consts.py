@@ -7,15 +7,106 @@ SHIP_SPEED = 5
 SHIP_TURN_ANGLE = 5
 
 MAX_NUM_BULLETS = 5
+FIRE_COOLDOWN_TICKS = 4
+
+KEY_LEFT = 1
+KEY_RIGHT = 2
+KEY_FIRE = 4
+KEY_TURBO = 8
+KEY_BOMB = 16
+KEY_BINDINGS = {
+    'Left': KEY_LEFT,
+    'Right': KEY_RIGHT,
+    'space': KEY_FIRE,
+    'x': KEY_TURBO,
+    'z': KEY_BOMB,
+}
 
 BULLET_BASE_SPEED = 10
 ENEMY_BASE_SPEED = 5
 DEATHSTAR_LASER_HIT_RADIUS = 50
 BULLET_ENEMY_HIT_RADIUS = 20
 SHIP_ENEMY_HIT_RADIUS = 25
+SPATIAL_CELL_SIZE = 50
+
+USE_ENTITY_STORE = False
+ENTITY_STORE_CAPACITY = 256
+
+POOL_SIZES = {
+    'Bullet': 16,
+    'TieBullet': 32,
+    'Laser': 16,
+    'Enemy': 128,
+    'TieFighter': 32,
+}
+
+DEATHSTAR_ENTRY_TICKS = 150
+
+EXPLOSION_SIZES = (50, 200)
+EXPLOSION_FRAMES = 6
+EXPLOSION_FRAME_DELAY = 50
+EXPLOSION_POOL_SIZE = 32
+MAX_EXPLOSIONS = 32
 
 SCORE_WAIT = 10
 
+ENEMY_SPAWN_CHANCE = 0.1
+# tie fighter, star burst, edge enemy
+ENEMY_STRATEGY_PROBS = (0.09, 0.03, 0.8)
+# score threshold, level, strategy probability changes; highest first
+LEVELS = (
+    (300, 5, {0: 1, 1: 0, 2: 0}),
+    (200, 4, {1: 0.05}),
+    (100, 3, {0: 0.15}),
+    (10, 2, {2: 1}),
+)
+BOSS_SCORE = 400
+
+GOVERNOR_BUDGET = 0.8
+GOVERNOR_SMOOTHING = 0.1
+GOVERNOR_DEGRADE_FRAMES = 15
+GOVERNOR_RECOVER_FRAMES = 90
+GOVERNOR_RECOVER_RATIO = 0.5
+SHED_EXPLOSION_FRAMES = 1
+SHED_PROJECTILE_ROTATION = 2
+SHED_SPAWNS = 3
+SHED_ENTITIES = 4
+GOVERNOR_SPAWN_SCALE = 0.4
+GOVERNOR_ENEMY_CAP = 60
+
 BOMB_FULL_POWER = 100
 BOMB_WAIT = 5
 BOMB_RADIUS = 300
+TURBO_DRAIN_INTERVAL = 50
+TIE_FIRE_DELAYS = (500, 900)
+
+VEC_ENEMY_SLOTS = 128
+
+REWIND_SECONDS = 10
+REWIND_STEP_SECONDS = 2
+
+SPRITE_CACHE_SIZE = 256
+SPRITE_ANGLE_STEP = 5
+
+PERF_WINDOW = 120
+PERF_OVERLAY_REFRESH = 10
+
+HUD_SLOW_REFRESH = 10
+
+ASSET_BUNDLE = 'images.bundle'
+ASSET_DECODE_WORKERS = 4
+ASSET_VARIANTS = [
+    ('images/deathstar.png', (500, 500)),
+    ('images/bullet2.png', (100, 50)),
+] + [
+    ('images/explode/%d.png' % (i + 1), (size, size))
+    for size in EXPLOSION_SIZES
+    for i in range(EXPLOSION_FRAMES)
+]
+
+SPLIT_MAX_RECORDS = 2048
+
+TELEMETRY_CAPACITY = 8192
+TELEMETRY_FLUSH_INTERVAL = 0.5
+TELEMETRY_MAX_BYTES = 8 * 1024 * 1024
+TELEMETRY_BACKUPS = 5
@@ -1,148 +1,230 @@
 import math
-from random import randint
 
-from gamelib import Sprite, GameApp, Text
+from gamelib import Sprite, GameApp, Text, sprite_cache
 
 from consts import *
 from math import atan, degrees, asin, cos, sin
+from telemetry import EVENT_BOSS_FIRE
 from utils import direction_to_dxdy, distance
 
-from PIL import Image,  ImageTk
-
 
 class FixedDirectionSprite(Sprite):
+    __slots__ = ('store', 'row', '_x', '_y', '_vx', '_vy', 'prev_x', 'prev_y')
+
+    hit_radius = 0
+    is_projectile = False
+
     def __init__(self, app, image_filename, x, y, vx, vy):
+        self.store = getattr(app, 'entity_store', None)
+        self.row = None
+        self.aim(vx, vy)
         super().__init__(app, image_filename, x, y)
+        self.prev_x = x
+        self.prev_y = y
+        self.vx = vx
+        self.vy = vy
+        if self.store is not None:
+            self.row = self.store.add(self, x, y, vx, vy, self.hit_radius)
+
+    @property
+    def x(self):
+        if self.row is None:
+            return self._x
+        return self.store.x[self.row]
+
+    @x.setter
+    def x(self, value):
+        if self.row is None:
+            self._x = value
+        else:
+            self.store.x[self.row] = value
+
+    @property
+    def y(self):
+        if self.row is None:
+            return self._y
+        return self.store.y[self.row]
+
+    @y.setter
+    def y(self, value):
+        if self.row is None:
+            self._y = value
+        else:
+            self.store.y[self.row] = value
+
+    @property
+    def vx(self):
+        if self.row is None:
+            return self._vx
+        return self.store.vx[self.row]
+
+    @vx.setter
+    def vx(self, value):
+        if self.row is None:
+            self._vx = value
+        else:
+            self.store.vx[self.row] = value
+
+    @property
+    def vy(self):
+        if self.row is None:
+            return self._vy
+        return self.store.vy[self.row]
+
+    @vy.setter
+    def vy(self, value):
+        if self.row is None:
+            self._vy = value
+        else:
+            self.store.vy[self.row] = value
+
+    def aim(self, vx, vy):
+        pass
+
+    def reset(self, x, y, vx, vy):
+        self.to_be_deleted = False
+        self.x = self.prev_x = x
+        self.y = self.prev_y = y
         self.vx = vx
         self.vy = vy
+        if self.store is not None:
+            self.row = self.store.add(self, x, y, vx, vy, self.hit_radius)
+        self.aim(vx, vy)
+        self.init_element()
+        if not (self.is_projectile and self.app.governor.sheds(SHED_PROJECTILE_ROTATION)):
+            self.refresh_image()
+        self.show()
+        self.render()
 
     def update(self):
+        if self.row is not None:
+            return
+        self.prev_x = self.x
+        self.prev_y = self.y
         self.x += self.vx
         self.y += self.vy
         if (self.x < 0) or (self.y < 0) or (self.x > CANVAS_WIDTH) or (self.y > CANVAS_HEIGHT):
             self.to_be_deleted = True
 
+    def delete(self):
+        super().delete()
+        if self.row is not None:
+            row = self.row
+            self._x, self._y = self.store.x[row], self.store.y[row]
+            self._vx, self._vy = self.store.vx[row], self.store.vy[row]
+            self.row = None
+            self.store.remove(row)
+
 
 class Bullet(FixedDirectionSprite):
+    __slots__ = ('angle',)
+
+    hit_radius = BULLET_ENEMY_HIT_RADIUS
+    is_projectile = True
+
     def __init__(self, app, x, y, vx, vy):
-        self.angle = degrees(atan(vy/vx))
         super().__init__(app, 'images/bullet1.png', x, y, vx, vy)
 
+    def aim(self, vx, vy):
+        self.angle = degrees(atan(vy/vx))
+
     def is_colliding_with_enemy(self, enemy):
         return self.is_within_distance(enemy, BULLET_ENEMY_HIT_RADIUS)
 
-    def init_canvas_object(self):
-        self.photo_image = Image.open(self.image_filename).convert("RGBA")
-        self.photo_image = self.photo_image.rotate(-self.angle)
-        self.photo_image = ImageTk.PhotoImage(image=self.photo_image)
-        self.canvas_object_id = self.canvas.create_image(
-            self.x,
-            self.y,
-            image=self.photo_image)
+    def sprite_angle(self):
+        return -self.angle
 
 
 class TieBullet(FixedDirectionSprite):
+    __slots__ = ('angle',)
+
+    is_projectile = True
+
     def __init__(self, app, x, y, vx, vy):
-        self.angle = degrees(atan(vy/vx))
         super().__init__(app, 'images/bullet2.png', x, y, vx, vy)
 
+    def aim(self, vx, vy):
+        self.angle = degrees(atan(vy/vx))
+
     def is_colliding_with_ship(self, tie):
         return self.is_within_distance(tie, SHIP_ENEMY_HIT_RADIUS)
 
-    def init_canvas_object(self):
-        self.photo_image = Image.open(self.image_filename).convert("RGBA")
-        self.photo_image = self.photo_image.rotate(-self.angle)
-        self.photo_image = ImageTk.PhotoImage(image=self.photo_image)
-        self.canvas_object_id = self.canvas.create_image(
-            self.x,
-            self.y,
-            image=self.photo_image)
+    def sprite_angle(self):
+        return -self.angle
 
 
 class Laser(TieBullet):
+    __slots__ = ()
+
+    image_size = (100, 50)
+
     def is_colliding_with_ship(self, tie):
         return self.is_within_distance(tie, DEATHSTAR_LASER_HIT_RADIUS)
 
-    def init_canvas_object(self):
-        self.photo_image = Image.open(self.image_filename).convert("RGBA")
-        self.photo_image = self.photo_image.resize(
-            (100, 50)).rotate(-self.angle)
-        self.photo_image = ImageTk.PhotoImage(image=self.photo_image)
-        self.canvas_object_id = self.canvas.create_image(
-            self.x,
-            self.y,
-            image=self.photo_image)
-
 
 class Enemy(FixedDirectionSprite):
+    __slots__ = ()
+
     def __init__(self, app, x, y, vx, vy):
         super().__init__(app, 'images/enemy1.png', x, y, vx, vy)
 
 
 class TieFighter(FixedDirectionSprite):
+    __slots__ = ('angle',)
+
     def __init__(self, app, x, y, vx, vy):
-        self.angle = -degrees(atan(vy/vx))
         self.app = app
+        super().__init__(app, "images/tie.png", x, y, vx, vy)
+
+    def aim(self, vx, vy):
+        self.angle = -degrees(atan(vy/vx))
         if vx < 0:
             self.angle = -degrees(atan(vy/vx)) + 180
-        super().__init__(app, "images/tie.png", x, y, vx, vy)
 
-    def init_canvas_object(self):
-        self.photo_image = Image.open(self.image_filename).convert("RGBA")
-        self.photo_image = ImageTk.PhotoImage(
-            image=self.photo_image.rotate(self.angle))
-        self.canvas_object_id = self.canvas.create_image(
-            self.x,
-            self.y,
-            image=self.photo_image)
-        self.app.after(500, self.fire)
-        self.app.after(900, self.fire)
+    def sprite_angle(self):
+        return self.angle
+
+    def init_element(self):
+        for delay in TIE_FIRE_DELAYS:
+            self.schedule(delay, self.fire)
 
     def fire(self):
         if self.app.bullet_count() >= MAX_NUM_BULLETS:
             return
 
         dx, dy = direction_to_dxdy(-self.angle)
-        bullet0 = TieBullet(self.app, self.x, self.y, dx *
-                            BULLET_BASE_SPEED, dy * BULLET_BASE_SPEED)
+        bullet0 = self.app.spawn(TieBullet, self.x, self.y, dx *
+                                 BULLET_BASE_SPEED, dy * BULLET_BASE_SPEED)
         self.app.add_enemy(bullet0)
 
 
 class DeathStar(Sprite):
+    __slots__ = ('in_screen', 'gunx', 'guny', 'angle')
+
+    image_size = (500, 500)
+
     def __init__(self, app):
         super().__init__(app, 'images/deathstar.png', -250, CANVAS_HEIGHT//2)
         self.app = app
         self.in_screen = False
 
-    def init_canvas_object(self):
-        self.photo_image = Image.open(self.image_filename).convert("RGBA")
-        self.photo_image = ImageTk.PhotoImage(
-            image=self.photo_image.resize((500, 500)))
-        self.canvas_object_id = self.canvas.create_image(
-            self.x,
-            self.y,
-            image=self.photo_image)
+    def init_element(self):
         self.gunx = 500*0.25
         self.guny = 500*0.425
 
-    def come_in(self, x=-250):
-        if x == 0:
+    def come_in(self, on_done=None):
+        def entered():
             self.in_screen = True
-            return
-        self.canvas.delete(self.canvas_object_id)
-        self.photo_image = Image.open(self.image_filename).convert("RGBA")
-        self.photo_image = ImageTk.PhotoImage(
-            self.photo_image.resize((500, 500)))
-        self.canvas_object_id = self.canvas.create_image(
-            x,
-            self.y,
-            image=self.photo_image)
-        self.app.after(20, lambda: self.come_in(x+1))
+            if on_done:
+                on_done()
+
+        return self.move_to(0, self.y, DEATHSTAR_ENTRY_TICKS, entered)
 
     def start_fire_dir_ship(self, shipx, shipy):
         guntoship = ((shipx-self.gunx)**2 + (shipy-self.guny)**2)**(1/2)
         self.angle = degrees(asin((shipy-self.guny)/guntoship))
-        print("fire!")
+        self.app.telemetry.record(EVENT_BOSS_FIRE, self.app.tick, self.angle,
+                                  self.app.bullet_count())
         self.fire()
 
     def fire(self):
@@ -150,46 +232,101 @@ class DeathStar(Sprite):
             return
 
         dx, dy = direction_to_dxdy(self.angle)
-        bullet0 = Laser(self.app, self.gunx, self.guny, dx *
-                        BULLET_BASE_SPEED, dy * BULLET_BASE_SPEED)
+        bullet0 = self.app.spawn(Laser, self.gunx, self.guny, dx *
+                                 BULLET_BASE_SPEED, dy * BULLET_BASE_SPEED)
         self.app.add_enemy(bullet0)
 
 
-class Explode(Sprite):
-    def __init__(self, app, x, y, size):
-        super().__init__(app, 'images/explode/1.png', x, y)
-        self.app = app
-        self.file_name = ["2,3,4,5,6"]
+class Explosion:
+    __slots__ = ('canvas_object_id', 'x', 'y', 'size', 'frames', 'frame', 'age')
+
+    def __init__(self, canvas_object_id, x, y, size, frames):
+        self.canvas_object_id = canvas_object_id
+        self.x = x
+        self.y = y
         self.size = size
+        self.frames = frames
+        self.frame = 0
+        self.age = 0
 
-    def init_canvas_object(self):
-        self.photo_image = Image.open(self.image_filename).convert("RGBA")
-        self.photo_image = ImageTk.PhotoImage(
-            image=self.photo_image)
-        self.canvas_object_id = self.canvas.create_image(
-            self.x,
-            self.y,
-            image=self.photo_image)
 
-    def update(self, image_name=1):
-        if image_name > 6:
-            self.app.canvas.delete(self.canvas_object_id)
-            return
-        full_image_name = "images/explode/" + str(image_name) + ".png"
-        self.canvas.delete(self.canvas_object_id)
-        self.photo_image = Image.open(full_image_name).convert("RGBA")
-        self.photo_image = ImageTk.PhotoImage(
-            self.photo_image.resize((self.size, self.size)))
-        self.canvas_object_id = self.canvas.create_image(
-            self.x,
-            self.y,
-            image=self.photo_image)
-        self.app.after(50, lambda: self.update(image_name+1))
+class ExplosionManager:
+    def __init__(self, app, sizes=EXPLOSION_SIZES,
+                 pool_size=EXPLOSION_POOL_SIZE, max_explosions=MAX_EXPLOSIONS):
+        self.app = app
+        self.canvas = app.canvas
+        self.max_explosions = max_explosions
+        self.frames = {}
+        for size in sizes:
+            self.load_frames(size)
+
+        self.free_items = [
+            self.canvas.create_image(0, 0, state="hidden")
+            for _ in range(pool_size)]
+        self.explosions = []
+        self.dropped = 0
+
+    def load_frames(self, size):
+        frames = [
+            sprite_cache.get("images/explode/%d.png" % (i + 1), (size, size))
+            for i in range(EXPLOSION_FRAMES)]
+        self.frames[size] = frames
+        return frames
+
+    def spawn(self, x, y, size):
+        if len(self.explosions) >= self.max_explosions or not self.free_items:
+            self.dropped += 1
+            return None
+
+        frames = self.frames.get(size) or self.load_frames(size)
+        item = self.free_items.pop()
+        renderer = self.app.renderer
+        renderer.move(item, x, y)
+        renderer.configure(item, image=frames[0], state="normal")
+        renderer.raise_item(item)
+
+        explosion = Explosion(item, x, y, size, frames)
+        self.explosions.append(explosion)
+        return explosion
+
+    def update(self, dt):
+        renderer = self.app.renderer
+        step = 2 if self.app.governor.sheds(SHED_EXPLOSION_FRAMES) else 1
+        remaining = []
+        for explosion in self.explosions:
+            explosion.age += dt
+            frame = explosion.age // EXPLOSION_FRAME_DELAY
+            frame -= frame % step
+            if frame >= len(explosion.frames):
+                renderer.configure(explosion.canvas_object_id, state="hidden")
+                self.free_items.append(explosion.canvas_object_id)
+                continue
+            if frame != explosion.frame:
+                explosion.frame = frame
+                renderer.configure(
+                    explosion.canvas_object_id, image=explosion.frames[frame])
+            remaining.append(explosion)
+        self.explosions = remaining
+
+    def count(self):
+        return len(self.explosions)
+
+    def clear(self):
+        renderer = self.app.renderer
+        for explosion in self.explosions:
+            renderer.configure(explosion.canvas_object_id, state="hidden")
+            self.free_items.append(explosion.canvas_object_id)
+        self.explosions = []
 
 
 class Ship(Sprite):
+    __slots__ = ('turbo', 'angle', 'direction', 'is_turning_left',
+                 'is_turning_right', 'atlas', 'prev_x', 'prev_y')
+
     def __init__(self, app, x, y):
         super().__init__(app, 'images/ship.png', x, y)
+        self.prev_x = x
+        self.prev_y = y
         self.turbo = False
         self.app = app
         self.angle = 0
@@ -198,9 +335,8 @@ class Ship(Sprite):
         self.is_turning_right = False
 
     def init_canvas_object(self):
-        self.photo_image = Image.open(self.image_filename).convert("RGBA")
-        self.photo_image = ImageTk.PhotoImage(
-            image=self.photo_image)
+        self.atlas = sprite_cache.atlas(self.image_filename, SHIP_TURN_ANGLE)
+        self.photo_image = self.atlas.frame(0)
         self.canvas_object_id = self.canvas.create_image(
             self.x,
             self.y,
@@ -212,6 +348,8 @@ class Ship(Sprite):
         self.y += dy*2 * SHIP_SPEED
 
     def update(self):
+        self.prev_x = self.x
+        self.prev_y = self.y
         if self.turbo == True:
             self.turbo_start()
         else:
@@ -224,14 +362,9 @@ class Ship(Sprite):
                 self.turn_right()
 
     def update_ship(self):
-        self.canvas.delete(self.canvas_object_id)
-        self.photo_image = Image.open(self.image_filename).convert("RGBA")
-        self.photo_image = ImageTk.PhotoImage(
-            self.photo_image.rotate(self.angle))
-        self.canvas_object_id = self.canvas.create_image(
-            self.x,
-            self.y,
-            image=self.photo_image)
+        self.photo_image = self.atlas.frame(self.angle)
+        self.app.renderer.configure(
+            self.canvas_object_id, image=self.photo_image)
 
     def start_turn(self, dir):
         if dir.upper() == 'LEFT':
@@ -265,6 +398,6 @@ class Ship(Sprite):
             return
 
         dx, dy = direction_to_dxdy(self.direction)
-        bullet0 = Bullet(self.app, self.x, self.y, dx *
-                         BULLET_BASE_SPEED, dy * BULLET_BASE_SPEED)
+        bullet0 = self.app.spawn(Bullet, self.x, self.y, dx *
+                                 BULLET_BASE_SPEED, dy * BULLET_BASE_SPEED)
         self.app.add_bullet(bullet0)
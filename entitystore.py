@@ -0,0 +1,137 @@
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from consts import ENTITY_STORE_CAPACITY
+
+
+def segment_mask(x0, y0, dx, dy, r):
+    l2 = dx*dx + dy*dy
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = np.where(l2 > 0, -(x0*dx + y0*dy) / l2, 0)
+    t = np.clip(t, 0, 1)
+    cx = x0 + t * dx
+    cy = y0 + t * dy
+    return cx*cx + cy*cy <= r * r
+
+
+class EntityStore:
+    def __init__(self, capacity=ENTITY_STORE_CAPACITY):
+        if np is None:
+            raise RuntimeError("EntityStore requires numpy")
+
+        self.capacity = capacity
+        self.x = np.zeros(capacity)
+        self.y = np.zeros(capacity)
+        self.px = np.zeros(capacity)
+        self.py = np.zeros(capacity)
+        self.vx = np.zeros(capacity)
+        self.vy = np.zeros(capacity)
+        self.radius = np.zeros(capacity)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.owners = [None] * capacity
+        self.free_rows = list(range(capacity - 1, -1, -1))
+
+    def grow(self):
+        old = self.capacity
+        self.capacity = old * 2
+        for name in ('x', 'y', 'px', 'py', 'vx', 'vy', 'radius', 'alive'):
+            array = getattr(self, name)
+            grown = np.zeros(self.capacity, dtype=array.dtype)
+            grown[:old] = array
+            setattr(self, name, grown)
+        self.owners.extend([None] * old)
+        self.free_rows.extend(range(self.capacity - 1, old - 1, -1))
+
+    def add(self, owner, x, y, vx, vy, radius=0):
+        if not self.free_rows:
+            self.grow()
+        row = self.free_rows.pop()
+        self.x[row] = self.px[row] = x
+        self.y[row] = self.py[row] = y
+        self.vx[row] = vx
+        self.vy[row] = vy
+        self.radius[row] = radius
+        self.alive[row] = True
+        self.owners[row] = owner
+        return row
+
+    def remove(self, row):
+        self.alive[row] = False
+        self.owners[row] = None
+        self.free_rows.append(row)
+
+    def count(self):
+        return self.capacity - len(self.free_rows)
+
+    def rows(self, elements):
+        return np.fromiter((e.row for e in elements), dtype=np.intp,
+                           count=len(elements))
+
+    def integrate(self):
+        np.copyto(self.px, self.x)
+        np.copyto(self.py, self.y)
+        np.add(self.x, self.vx, out=self.x, where=self.alive)
+        np.add(self.y, self.vy, out=self.y, where=self.alive)
+
+    def cull(self, width, height):
+        x = self.x
+        y = self.y
+        outside = self.alive & ((x < 0) | (y < 0) | (x > width) | (y > height))
+        rows = np.flatnonzero(outside)
+        for row in rows:
+            self.owners[row].to_be_deleted = True
+        return rows
+
+    def collision_mask(self, rows_a, rows_b, radius=None):
+        dx = self.x[rows_a][:, None] - self.x[rows_b][None, :]
+        dy = self.y[rows_a][:, None] - self.y[rows_b][None, :]
+        if radius is None:
+            radius = self.radius[rows_a][:, None] + self.radius[rows_b][None, :]
+        return dx*dx + dy*dy <= radius * radius
+
+    def collision_pairs(self, elements_a, elements_b, radius=None):
+        if not elements_a or not elements_b:
+            return []
+        mask = self.collision_mask(
+            self.rows(elements_a), self.rows(elements_b), radius)
+        return [(elements_a[i], elements_b[j]) for i, j in zip(*np.nonzero(mask))]
+
+    def swept_mask(self, rows_a, rows_b, radius=None):
+        # relative motion of every a/b pair over the last tick, tested as a
+        # segment against a circle around the origin
+        x0 = self.px[rows_a][:, None] - self.px[rows_b][None, :]
+        y0 = self.py[rows_a][:, None] - self.py[rows_b][None, :]
+        dx = self.x[rows_a][:, None] - self.x[rows_b][None, :] - x0
+        dy = self.y[rows_a][:, None] - self.y[rows_b][None, :] - y0
+        if radius is None:
+            radius = self.radius[rows_a][:, None] + self.radius[rows_b][None, :]
+        return segment_mask(x0, y0, dx, dy, radius)
+
+    def swept_pairs(self, elements_a, elements_b, radius=None):
+        if not elements_a or not elements_b:
+            return []
+        mask = self.swept_mask(
+            self.rows(elements_a), self.rows(elements_b), radius)
+        return [(elements_a[i], elements_b[j]) for i, j in zip(*np.nonzero(mask))]
+
+    def swept_within(self, elements, x0, y0, x1, y1, r):
+        if not elements:
+            return []
+        rows = self.rows(elements)
+        sx = x0 - self.px[rows]
+        sy = y0 - self.py[rows]
+        dx = x1 - self.x[rows] - sx
+        dy = y1 - self.y[rows] - sy
+        mask = segment_mask(sx, sy, dx, dy, r)
+        return [elements[i] for i in np.flatnonzero(mask)]
+
+    def within_radius(self, elements, x, y, r):
+        if not elements:
+            return []
+        rows = self.rows(elements)
+        dx = self.x[rows] - x
+        dy = self.y[rows] - y
+        mask = dx*dx + dy*dy <= r * r
+        return [elements[i] for i in np.flatnonzero(mask)]
@@ -1,18 +1,165 @@
+import time
 import tkinter as tk
 import tkinter.ttk as ttk
 
 from abc import ABC, abstractmethod
-from utils import distance
+from collections import OrderedDict
+from consts import SPRITE_CACHE_SIZE, SPRITE_ANGLE_STEP, PERF_OVERLAY_REFRESH, SHED_SPAWNS
+from governor import FrameGovernor
+from headless import NullCanvas, VirtualClock
+from keystate import KeyState
+from perf import MemoryReport, PerfMonitor
+from renderer import BatchRenderer
+from scheduler import Scheduler
+from telemetry import Telemetry, EVENT_FRAME
+from utils import distance, distance_sq
+
+from PIL import Image, ImageTk
+
+
+LAUNCH_TIME = time.perf_counter()
+
+
+def decode_image(filename):
+    return Image.open(filename).convert("RGBA")
+
+
+class SpriteCache:
+    def __init__(self, max_size=SPRITE_CACHE_SIZE, angle_step=SPRITE_ANGLE_STEP):
+        self.max_size = max_size
+        self.angle_step = angle_step
+        self.images = OrderedDict()
+        self.sources = {}
+        self.pending = {}
+        self.atlases = {}
+        self.bundle = None
+        self.hits = 0
+        self.misses = 0
+        self.photo_images = True
+
+    def quantize_angle(self, angle):
+        return (round(angle / self.angle_step) * self.angle_step) % 360
+
+    def get(self, filename, size=None, angle=0):
+        key = (filename, size, self.quantize_angle(angle))
+        image = self.images.get(key)
+        if image is not None:
+            self.hits += 1
+            self.images.move_to_end(key)
+            return image
+
+        self.misses += 1
+        image = self.photo(self.load(*key))
+        self.images[key] = image
+        if len(self.images) > self.max_size:
+            self.images.popitem(last=False)
+        return image
+
+    def photo(self, image):
+        if self.photo_images:
+            return ImageTk.PhotoImage(image=image)
+        return image
+
+    def source(self, filename):
+        source = self.sources.get(filename)
+        if source is None:
+            future = self.pending.pop(filename, None)
+            if future is not None:
+                source = future.result()
+            else:
+                source = decode_image(filename)
+            self.sources[filename] = source
+        return source
+
+    def preload(self, filenames, executor):
+        for filename in filenames:
+            if filename in self.sources or filename in self.pending:
+                continue
+            if self.bundle is not None and filename in self.bundle:
+                continue
+            self.pending[filename] = executor.submit(decode_image, filename)
+
+    def load(self, filename, size, angle):
+        source = None
+        if self.bundle is not None:
+            source = self.bundle.get(filename, size)
+        if source is None:
+            source = self.source(filename)
+            if size is not None:
+                source = source.resize(size)
+        if angle:
+            source = source.rotate(angle)
+        return source
+
+    def atlas(self, filename, step, size=None):
+        key = (filename, step, size)
+        atlas = self.atlases.get(key)
+        if atlas is None:
+            atlas = RotationAtlas(self, filename, step, size)
+            self.atlases[key] = atlas
+        return atlas
+
+    def clear(self):
+        self.images.clear()
+        self.sources.clear()
+        self.pending.clear()
+        self.atlases.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+class RotationAtlas:
+    def __init__(self, cache, filename, step, size=None):
+        self.step = step
+        self.frames = [
+            cache.photo(cache.load(filename, size, angle))
+            for angle in range(0, 360, step)]
+
+    def frame(self, angle):
+        return self.frames[round(angle / self.step) % len(self.frames)]
+
+
+sprite_cache = SpriteCache()
+
+
+class Hud:
+    def __init__(self):
+        self.labels = []
+        self.frame = 0
+        self.redraws = 0
+        self.coalesced = 0
+        self.unchanged = 0
+
+    def add(self, label):
+        self.labels.append(label)
+
+    @property
+    def skipped(self):
+        return self.coalesced + self.unchanged
+
+    def flush(self):
+        self.frame += 1
+        for label in self.labels:
+            if label.dirty and self.frame % label.refresh_every == 0:
+                if label.update_label():
+                    self.redraws += 1
+                else:
+                    self.unchanged += 1
 
 
 class StatusWithText:
-    def __init__(self, app, x, y, text_template, default_value=0):
+    def __init__(self, app, x, y, text_template, default_value=0, refresh_every=1):
         self.x = x
         self.y = y
         self.text_template = text_template
+        self.refresh_every = refresh_every
         self._value = default_value
+        self.hud = app.hud
+        self.dirty = False
+        self.drawn_text = None
         self.label_text = Text(app, '', x, y)
         self.update_label()
+        self.hud.add(self)
 
     @property
     def value(self):
@@ -21,10 +168,71 @@ class StatusWithText:
     @value.setter
     def value(self, v):
         self._value = v
-        self.update_label()
+        if self.dirty:
+            self.hud.coalesced += 1
+        self.dirty = True
 
     def update_label(self):
-        self.label_text.set_text(self.text_template % self.value)
+        self.dirty = False
+        text = self.text_template % self.value
+        if text == self.drawn_text:
+            return False
+        self.drawn_text = text
+        self.label_text.set_text(text)
+        return True
+
+
+class PerfOverlay:
+    PHASES = ('pre_update', 'process_collisions', 'update_and_filter_deleted',
+              'render', 'flush')
+
+    def __init__(self, app, x, y, line_height=16):
+        self.app = app
+        self.frame = StatusWithText(
+            app, x, y, 'frame p50 %.1f  p95 %.1f  max %.1f ms', (0, 0, 0))
+        self.rate = StatusWithText(
+            app, x, y + line_height, 'tick rate %.1f Hz (target %.1f Hz)', (0, 0))
+        self.phases = StatusWithText(
+            app, x, y + line_height*2,
+            'pre %.2f  coll %.2f  update %.2f  render %.2f  flush %.2f ms',
+            (0, 0, 0, 0, 0))
+        self.input = StatusWithText(
+            app, x, y + line_height*3, 'input latency p50 %.1f  p95 %.1f  max %.1f ms',
+            (0, 0, 0))
+        self.governor = StatusWithText(
+            app, x, y + line_height*4, 'load stage %d (%s)  avg %.1f ms / budget %.1f ms',
+            (0, '', 0, 0))
+        self.counts = StatusWithText(app, x, y + line_height*5, '%s', '')
+        self.lines = [self.frame, self.rate, self.phases, self.input, self.governor,
+                      self.counts]
+        self.is_visible = True
+
+    def show(self):
+        self.is_visible = True
+        for line in self.lines:
+            line.label_text.show()
+
+    def hide(self):
+        self.is_visible = False
+        for line in self.lines:
+            line.label_text.hide()
+
+    def refresh(self):
+        perf = self.app.perf
+        self.frame.value = perf.frame_stats()
+        self.rate.value = (perf.tick_rate(), 1000 / self.app.update_delay)
+        self.phases.value = tuple(perf.phase_ms(name) for name in self.PHASES)
+        self.input.value = self.app.keys.latency_stats()
+        self.governor.value = self.app.governor.status()
+        counts = self.app.perf_counts()
+        counts['canvas items'] = len(self.app.canvas.find_all())
+        counts['tcl calls'] = self.app.renderer.tcl_calls
+        counts['changes'] = self.app.renderer.changes
+        counts['hud skipped'] = self.app.hud.skipped
+        if self.app.telemetry.enabled:
+            counts['telemetry dropped'] = self.app.telemetry.dropped
+        self.counts.value = '  '.join(
+            '%s: %d' % (name, value) for name, value in counts.items())
 
 
 class KeyboardHandler:
@@ -36,6 +244,49 @@ class KeyboardHandler:
             self.successor.handle(event)
 
 
+class ElementPool:
+    def __init__(self, factory, size):
+        self.factory = factory
+        self.size = size
+        self.free = []
+        self.in_use = 0
+        self.created = 0
+        self.reused = 0
+
+    def acquire(self, *args):
+        if self.free:
+            element = self.free.pop()
+            element.in_pool = False
+            element.reset(*args)
+            self.reused += 1
+        else:
+            element = self.factory(*args)
+            element.pool = self
+            self.created += 1
+        self.in_use += 1
+        return element
+
+    def release(self, element):
+        if element.in_pool:
+            return True
+        self.in_use -= 1
+        if len(self.free) >= self.size:
+            return False
+        element.hide()
+        element.in_pool = True
+        self.free.append(element)
+        return True
+
+    def occupancy(self):
+        return {
+            'in_use': self.in_use,
+            'free': len(self.free),
+            'size': self.size,
+            'created': self.created,
+            'reused': self.reused,
+        }
+
+
 class EnemyGenerationStrategy(ABC):
     @abstractmethod
     def generate(self, space_game, ship):
@@ -43,6 +294,7 @@ class EnemyGenerationStrategy(ABC):
 
 
 class GameElement(ABC):
+    __slots__ = ()
 
     @abstractmethod
     def show(self):
@@ -61,15 +313,57 @@ class GameElement(ABC):
         pass
 
 
+class Tween:
+    def __init__(self, element, x, y, steps, on_done=None):
+        self.element = element
+        self.x = x
+        self.y = y
+        self.remaining = max(1, steps)
+        self.dx = (x - element.x) / self.remaining
+        self.dy = (y - element.y) / self.remaining
+        self.on_done = on_done
+        self.is_done = False
+
+    def step(self):
+        if self.is_done:
+            return True
+
+        element = self.element
+        self.remaining -= 1
+        if self.remaining <= 0:
+            element.x = self.x
+            element.y = self.y
+            self.is_done = True
+        else:
+            element.x += self.dx
+            element.y += self.dy
+        element.render()
+
+        if self.is_done and self.on_done:
+            self.on_done()
+        return self.is_done
+
+    def cancel(self):
+        self.is_done = True
+
+
 class GameCanvasElement(GameElement):
+    __slots__ = ('x', 'y', 'app', 'canvas', 'canvas_object_id', 'is_visible',
+                 'pool', 'in_pool', 'drawn_x', 'drawn_y', 'to_be_deleted')
+
     def __init__(self, game_app, x=0, y=0):
         self.x = x
         self.y = y
+        self.app = game_app
         self.canvas = game_app.canvas
 
         self.is_visible = True
+        self.pool = None
+        self.in_pool = False
 
         self.init_canvas_object()
+        self.drawn_x = x
+        self.drawn_y = y
         self.init_element()
 
         self.to_be_deleted = False
@@ -78,19 +372,21 @@ class GameCanvasElement(GameElement):
         return distance(self.x, self.y, element.x, element.y)
 
     def is_within_distance(self, element, d):
-        return self.distance_to(element) <= d
+        return distance_sq(self.x, self.y, element.x, element.y) <= d*d
 
     def show(self):
         self.is_visible = True
-        self.canvas.itemconfigure(self.canvas_object_id, state="normal")
+        self.app.renderer.configure(self.canvas_object_id, state="normal")
 
     def hide(self):
         self.is_visible = False
-        self.canvas.itemconfigure(self.canvas_object_id, state="hidden")
+        self.app.renderer.configure(self.canvas_object_id, state="hidden")
 
     def render(self):
-        if self.is_visible:
-            self.canvas.coords(self.canvas_object_id, self.x, self.y)
+        if self.is_visible and (self.x != self.drawn_x or self.y != self.drawn_y):
+            self.drawn_x = self.x
+            self.drawn_y = self.y
+            self.app.renderer.move(self.canvas_object_id, self.x, self.y)
 
     def animate(self):
         if not self.is_stopped:
@@ -113,13 +409,26 @@ class GameCanvasElement(GameElement):
         self.after(self.update_delay, self.animate)
 
     def delete(self):
+        self.app.scheduler.cancel_owner(self)
+        if self.pool is not None and self.pool.release(self):
+            return
+        self.app.renderer.discard(self.canvas_object_id)
         self.canvas.delete(self.canvas_object_id)
 
+    def schedule(self, delay, func, *args, interval=None):
+        return self.app.scheduler.schedule(
+            delay, func, *args, owner=self, interval=interval)
+
+    def move_to(self, x, y, steps, on_done=None):
+        tween = Tween(self, x, y, steps, on_done)
+        self.app.add_tween(tween)
+        return tween
+
     def distance_to(self, element):
         return distance(self.x, self.y, element.x, element.y)
 
     def is_within_distance(self, element, d):
-        return self.distance_to(element) <= d
+        return distance_sq(self.x, self.y, element.x, element.y) <= d*d
 
     def init_canvas_object(self):
         pass
@@ -132,6 +441,8 @@ class GameCanvasElement(GameElement):
 
 
 class Text(GameCanvasElement):
+    __slots__ = ('text',)
+
     def __init__(self, game_app, text, x=0, y=0):
         self.text = text
         super().__init__(game_app, x, y)
@@ -149,48 +460,112 @@ class Text(GameCanvasElement):
 
 
 class Sprite(GameCanvasElement):
+    __slots__ = ('image_filename', 'photo_image')
+
+    image_size = None
+
     def __init__(self, game_app, image_filename, x=0, y=0):
         self.image_filename = image_filename
         super().__init__(game_app, x, y)
 
+    def sprite_angle(self):
+        return 0
+
     def init_canvas_object(self):
-        self.photo_image = tk.PhotoImage(file=self.image_filename)
+        self.photo_image = sprite_cache.get(
+            self.image_filename, self.image_size, self.sprite_angle())
         self.canvas_object_id = self.canvas.create_image(
             self.x,
             self.y,
             image=self.photo_image)
 
+    def refresh_image(self):
+        image = sprite_cache.get(
+            self.image_filename, self.image_size, self.sprite_angle())
+        if image is not self.photo_image:
+            self.photo_image = image
+            self.app.renderer.configure(self.canvas_object_id, image=image)
+
 
 class GameApp(ttk.Frame):
-    def __init__(self, parent, canvas_width=800, canvas_height=500, update_delay=33):
-        super().__init__(parent)
+    def __init__(self, parent, canvas_width=800, canvas_height=500, update_delay=33,
+                 headless=False, backend='canvas'):
+        self.headless = headless
+        self.backend = backend
+        if headless:
+            self.clock = VirtualClock()
+            sprite_cache.photo_images = False
+        else:
+            super().__init__(parent)
+            self.clock = None
         self.parent = parent
 
         self.canvas_width = canvas_width
         self.canvas_height = canvas_height
 
         self.update_delay = update_delay
-
-        self.grid(sticky="news")
+        self.tick = 0
+        self.scheduler = Scheduler()
+        self.perf = PerfMonitor()
+        self.perf_overlay = None
+        self.governor = FrameGovernor(update_delay, enabled=not headless)
+        self.memory = MemoryReport()
+        self.telemetry = Telemetry()
+        self.recorder = None
+        self.replayer = None
+        self.max_ticks = None
+        self.first_frame_ms = None
+
+        if not headless:
+            self.grid(sticky="news")
         self.create_canvas()
+        self.renderer = BatchRenderer(self.canvas)
+        self.hud = Hud()
+        self.keys = KeyState()
         self.key_pressed_handler = KeyboardHandler()
         self.key_released_handler = KeyboardHandler()
 
         self.elements = []
+        self.tweens = []
         self.init_game()
 
         self.is_stopped = False
 
-        self.parent.bind('<KeyPress>', self.on_key_pressed)
-        self.parent.bind('<KeyRelease>', self.on_key_released)
+        if not headless:
+            self.parent.bind('<KeyPress>', self.on_key_pressed)
+            self.parent.bind('<KeyRelease>', self.on_key_released)
 
     def on_key_pressed(self, event):
+        if self.replayer is not None:
+            return
+        if self.recorder is not None:
+            self.recorder.record(self.tick, 'press', event)
         self.key_pressed_handler.handle(event)
 
     def on_key_released(self, event):
+        if self.replayer is not None:
+            return
+        if self.recorder is not None:
+            self.recorder.record(self.tick, 'release', event)
         self.key_released_handler.handle(event)
 
     def create_canvas(self):
+        if self.backend == 'composite':
+            from compositor import CompositingCanvas
+            # sprites are blended into one frame image, so the cache hands
+            # out PIL images instead of per-sprite PhotoImages
+            sprite_cache.photo_images = False
+            target = None
+            if not self.headless:
+                target = tk.Canvas(self, borderwidth=0,
+                                   width=self.canvas_width, height=self.canvas_height,
+                                   highlightthickness=0)
+            self.canvas = CompositingCanvas(self.canvas_width, self.canvas_height, target)
+            self.canvas.grid(sticky="news")
+            return
+        if self.headless:
+            self.canvas = NullCanvas(self.canvas_width, self.canvas_height)
+            return
         self.canvas = tk.Canvas(self, borderwidth=0,
                                 width=self.canvas_width, height=self.canvas_height,
                                 highlightthickness=0)
@@ -202,9 +577,22 @@ class GameApp(ttk.Frame):
     def resume_animation(self):
         self.is_stopped = False
 
+    def after(self, ms, func=None, *args):
+        if self.clock is not None:
+            return self.clock.after(ms, func, *args)
+        return super().after(ms, func, *args)
+
     def animate(self):
+        perf = self.perf
+        frame_start = time.perf_counter()
+        if self.replayer is not None:
+            self.replayer.apply(self)
         if not self.is_stopped:
+            self.tick += 1
+            self.scheduler.advance(self.update_delay)
+            t = perf.start()
             self.pre_update()
+            perf.lap('pre_update', t)
 
             remaining_elements = []
             for element in self.elements:
@@ -218,13 +606,92 @@ class GameApp(ttk.Frame):
 
             self.elements = remaining_elements
 
+            self.update_tweens()
+
             self.post_update()
 
-        self.after(self.update_delay, self.animate)
+            if self.max_ticks is not None and self.tick >= self.max_ticks:
+                self.stop_animation()
+
+        self.update_effects()
+
+        t = perf.start()
+        self.hud.flush()
+        self.renderer.flush()
+        if self.backend == 'composite':
+            self.canvas.present()
+        perf.lap('flush', t)
+        self.keys.frame_rendered()
+
+        if self.first_frame_ms is None:
+            self.report_first_frame()
+
+        self.memory.end_frame()
+
+        if perf.enabled:
+            perf.end_frame(frame_start)
+            if self.tick % PERF_OVERLAY_REFRESH == 0:
+                self.perf_overlay.refresh()
+
+        elapsed = time.perf_counter() - frame_start
+        self.governor.end_frame(elapsed)
+        self.telemetry.record(EVENT_FRAME, self.tick, elapsed * 1000, self.governor.stage)
+        delay = self.update_delay
+        if not self.headless:
+            # keep the tick rate steady by only waiting out what is left of
+            # the frame; the virtual clock stays on a fixed step
+            delay = max(1, delay - int(elapsed * 1000))
+        self.after(delay, self.animate)
+
+    def report_first_frame(self):
+        if not self.headless:
+            self.update_idletasks()
+        self.first_frame_ms = (time.perf_counter() - LAUNCH_TIME) * 1000
+        if not self.headless:
+            print("first frame after %.0f ms" % self.first_frame_ms)
+
+    def toggle_perf_overlay(self):
+        if self.perf.enabled:
+            self.perf.disable()
+            self.perf_overlay.hide()
+            return
+
+        if self.perf_overlay is None:
+            self.perf_overlay = PerfOverlay(self, self.canvas_width // 2, 60)
+        else:
+            self.perf_overlay.show()
+        self.perf.enable()
+
+    def perf_counts(self):
+        return {'elements': len(self.elements)}
+
+    def entities(self):
+        return list(self.elements)
+
+    def memory_report(self):
+        return self.memory.report(self.entities())
+
+    def add_tween(self, tween):
+        self.tweens.append(tween)
+
+    def update_tweens(self):
+        if self.tweens:
+            self.tweens = [t for t in self.tweens if not t.step()]
 
     def start(self):
+        if self.recorder is not None or self.replayer is not None:
+            # stages from throttled spawns on change the game itself, and
+            # depend on wall clock frame costs a replay cannot reproduce
+            self.governor.limit(SHED_SPAWNS - 1)
         self.after(0, self.animate)
 
+    def run_headless(self, max_ticks):
+        self.start()
+        while self.tick < max_ticks and not self.is_stopped:
+            if not self.clock.run_next():
+                break
+        return self.tick
+
     def init_game(self):
         pass
 
@@ -233,3 +700,6 @@ class GameApp(ttk.Frame):
 
     def post_update(self):
         pass
+
+    def update_effects(self):
+        pass
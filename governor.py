@@ -0,0 +1,59 @@
+from consts import (GOVERNOR_BUDGET, GOVERNOR_SMOOTHING, GOVERNOR_DEGRADE_FRAMES,
+                    GOVERNOR_RECOVER_FRAMES, GOVERNOR_RECOVER_RATIO)
+
+STAGE_NAMES = ('full quality', 'fewer explosion frames', 'no projectile rotation',
+               'throttled spawns', 'entity caps')
+MAX_STAGE = len(STAGE_NAMES) - 1
+
+
+class FrameGovernor:
+    def __init__(self, update_delay, enabled=True):
+        self.budget = update_delay / 1000 * GOVERNOR_BUDGET
+        self.enabled = enabled
+        self.stage = 0
+        self.max_stage = MAX_STAGE
+        self.average = 0
+        self.over = 0
+        self.under = 0
+        self.changes = 0
+
+    def end_frame(self, cost):
+        if not self.enabled:
+            return
+        self.average += (cost - self.average) * GOVERNOR_SMOOTHING
+
+        # degrade quickly, recover slowly and only well under budget, so a
+        # stage that just brought the cost down does not flip straight back
+        if self.average > self.budget:
+            self.under = 0
+            self.over += 1
+            if self.over >= GOVERNOR_DEGRADE_FRAMES and self.stage < self.max_stage:
+                self.set_stage(self.stage + 1)
+        elif self.average < self.budget * GOVERNOR_RECOVER_RATIO:
+            self.over = 0
+            self.under += 1
+            if self.under >= GOVERNOR_RECOVER_FRAMES and self.stage > 0:
+                self.set_stage(self.stage - 1)
+        else:
+            self.over = 0
+            self.under = 0
+
+    def set_stage(self, stage):
+        self.stage = stage
+        self.over = 0
+        self.under = 0
+        self.changes += 1
+
+    def limit(self, max_stage):
+        self.max_stage = max_stage
+        if self.stage > max_stage:
+            self.set_stage(max_stage)
+
+    def sheds(self, stage):
+        return self.stage >= stage
+
+    def stage_name(self):
+        return STAGE_NAMES[self.stage]
+
+    def status(self):
+        return (self.stage, self.stage_name(), self.average * 1000, self.budget * 1000)
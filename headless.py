@@ -0,0 +1,109 @@
+import heapq
+from itertools import count
+
+
+class NullCanvas:
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.items = {}
+        self.next_id = count(1)
+        self.calls = 0
+
+    def create_item(self, kind, coords, options):
+        self.calls += 1
+        item = next(self.next_id)
+        self.items[item] = [kind, list(coords), options]
+        return item
+
+    def create_image(self, *coords, **options):
+        return self.create_item('image', coords, options)
+
+    def create_text(self, *coords, **options):
+        return self.create_item('text', coords, options)
+
+    def create_oval(self, *coords, **options):
+        return self.create_item('oval', coords, options)
+
+    def create_rectangle(self, *coords, **options):
+        return self.create_item('rectangle', coords, options)
+
+    def coords(self, item, *coords):
+        self.calls += 1
+        entry = self.items.get(item)
+        if entry is None:
+            return []
+        if coords:
+            entry[1] = list(coords)
+        return entry[1]
+
+    def move(self, item, dx, dy):
+        self.calls += 1
+        entry = self.items.get(item)
+        if entry is not None:
+            entry[1][0] += dx
+            entry[1][1] += dy
+
+    def itemconfigure(self, item, **options):
+        self.calls += 1
+        entry = self.items.get(item)
+        if entry is not None:
+            entry[2].update(options)
+
+    itemconfig = itemconfigure
+
+    def delete(self, item):
+        self.calls += 1
+        self.items.pop(item, None)
+
+    def tag_raise(self, item):
+        self.calls += 1
+        entry = self.items.pop(item, None)
+        if entry is not None:
+            self.items[item] = entry
+
+    def apply_batch(self, moves, options, raised):
+        self.calls += 1
+        items = self.items
+        for item, (x, y) in moves.items():
+            entry = items.get(item)
+            if entry is not None:
+                entry[1] = [x, y]
+        for item, item_options in options.items():
+            entry = items.get(item)
+            if entry is not None:
+                entry[2].update(item_options)
+        for item in raised:
+            entry = items.pop(item, None)
+            if entry is not None:
+                items[item] = entry
+
+    def find_all(self):
+        return tuple(self.items)
+
+
+class VirtualClock:
+    def __init__(self):
+        self.now = 0
+        self.queue = []
+        self.next_id = count()
+        self.cancelled = set()
+
+    def after(self, ms, func=None, *args):
+        timer_id = next(self.next_id)
+        heapq.heappush(self.queue, (self.now + ms, timer_id, func, args))
+        return timer_id
+
+    def after_cancel(self, timer_id):
+        self.cancelled.add(timer_id)
+
+    def run_next(self):
+        while self.queue:
+            due, timer_id, func, args = heapq.heappop(self.queue)
+            if timer_id in self.cancelled:
+                self.cancelled.discard(timer_id)
+                continue
+            self.now = max(self.now, due)
+            func(*args)
+            return True
+        return False
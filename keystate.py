@@ -0,0 +1,68 @@
+import time
+from collections import deque
+
+from consts import PERF_WINDOW
+from perf import percentile
+
+
+class KeyState:
+    def __init__(self, window=PERF_WINDOW):
+        self.bindings = {}
+        self.held = 0
+        self.latched = 0
+        self.down = 0
+        self.pending_since = None
+        self.sampled_since = None
+        self.latencies = deque(maxlen=window)
+
+    def bind(self, keysym, bit):
+        self.bindings[keysym] = bit
+
+    def bit_for(self, event):
+        keysym = event.keysym
+        if len(keysym) == 1:
+            keysym = keysym.lower()
+        return self.bindings.get(keysym, 0)
+
+    def press(self, bit):
+        if not self.held & bit:
+            self.held |= bit
+            self.latched |= bit
+            self.mark_pending()
+
+    def release(self, bit):
+        if self.held & bit:
+            self.held &= ~bit
+            self.mark_pending()
+
+    def mark_pending(self):
+        if self.pending_since is None:
+            self.pending_since = time.perf_counter()
+
+    def sample(self):
+        # a tap that starts and ends between two ticks still shows up as
+        # down, pressed and released in the tick that samples it
+        down = self.held | self.latched
+        pressed = self.latched
+        released = (self.down | self.latched) & ~self.held
+        self.down = self.held
+        self.latched = 0
+        if self.pending_since is not None:
+            if self.sampled_since is None:
+                self.sampled_since = self.pending_since
+            self.pending_since = None
+        return down, pressed, released
+
+    def frame_rendered(self):
+        if self.sampled_since is not None:
+            self.latencies.append(time.perf_counter() - self.sampled_since)
+            self.sampled_since = None
+
+    def latency_stats(self):
+        latencies = self.latencies
+        if not latencies:
+            return (0, 0, 0)
+        return (percentile(latencies, 0.5) * 1000,
+                percentile(latencies, 0.95) * 1000,
+                max(latencies) * 1000)
+
@@ -1,13 +1,24 @@
+import argparse
 import math
-from random import randint, random
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
 import tkinter as tk
 
-from gamelib import Sprite, GameApp, Text, EnemyGenerationStrategy, KeyboardHandler, StatusWithText
+from assets import image_files, load_bundle
+from gamelib import Sprite, GameApp, Text, EnemyGenerationStrategy, KeyboardHandler, StatusWithText, ElementPool, sprite_cache
 from PIL import Image, ImageTk
 from consts import *
-from elements import Ship, Bullet, Enemy, TieFighter, Explode, DeathStar
-from utils import random_edge_position, normalize_vector, direction_to_dxdy, vector_len, distance
+from elements import Ship, Bullet, TieBullet, Laser, Enemy, TieFighter, ExplosionManager, DeathStar
+from entitystore import EntityStore
+from replay import InputRecorder, InputReplayer, load_recording
+from snapshot import RewindBuffer, restore_snapshot, take_snapshot
+from spatial import SpatialHash
+from telemetry import EVENT_SPAWN, EVENT_KILL, EVENT_BOMB, EVENT_SHIP_HIT
+from utils import random_edge_position, normalize_vector, direction_to_dxdy, vector_len, distance, rng, seed_rng, segment_within
 
 
 class GameKeyboardHandler(KeyboardHandler):
@@ -17,53 +28,57 @@ class GameKeyboardHandler(KeyboardHandler):
         self.ship = ship
 
 
-class BombKeyPressedHandler(GameKeyboardHandler):
+class PerfOverlayKeyPressedHandler(GameKeyboardHandler):
     def handle(self, event):
-        if event.char.upper() == 'Z':
-            self.game_app.bomb()
+        if event.keysym == 'F3':
+            self.game_app.toggle_perf_overlay()
         else:
             super().handle(event)
 
 
-class ShipMovementKeyPressedHandler(GameKeyboardHandler):
+class RewindKeyPressedHandler(GameKeyboardHandler):
     def handle(self, event):
-        if event.keysym.upper() == "X":
-            self.ship.turbo = True
-        elif event.keysym == 'Left':
-            self.ship.start_turn('LEFT')
-        elif event.keysym == 'Right':
-            self.ship.start_turn('RIGHT')
-        elif event.char == ' ':
-            self.ship.fire()
-        elif event.char.upper() == 'Z':
-            self.bomb()
+        if event.keysym == 'BackSpace':
+            self.game_app.rewind_by(REWIND_STEP_SECONDS)
+        else:
+            super().handle(event)
 
 
-class ShipMovementKeyReleasedHandler(GameKeyboardHandler):
+class KeyStatePressedHandler(GameKeyboardHandler):
     def handle(self, event):
-        if event.keysym.upper() == "X":
-            self.ship.turbo = False
-        elif event.keysym == 'Left':
-            self.ship.stop_turn('LEFT')
-        elif event.keysym == 'Right':
-            self.ship.stop_turn('RIGHT')
+        keys = self.game_app.keys
+        bit = keys.bit_for(event)
+        if bit:
+            keys.press(bit)
+        else:
+            super().handle(event)
+
+
+class KeyStateReleasedHandler(GameKeyboardHandler):
+    def handle(self, event):
+        keys = self.game_app.keys
+        bit = keys.bit_for(event)
+        if bit:
+            keys.release(bit)
+        else:
+            super().handle(event)
 
 
 class StarEnemyGenerationStrategy(EnemyGenerationStrategy):
     def generate(self, space_game, ship):
 
         enemies = []
-        x = randint(100, CANVAS_WIDTH - 100)
-        y = randint(100, CANVAS_HEIGHT - 100)
+        x = rng.randint(100, CANVAS_WIDTH - 100)
+        y = rng.randint(100, CANVAS_HEIGHT - 100)
 
         while vector_len(x - ship.x, y - ship.y) < 200:
-            x = randint(100, CANVAS_WIDTH - 100)
-            y = randint(100, CANVAS_HEIGHT - 100)
+            x = rng.randint(100, CANVAS_WIDTH - 100)
+            y = rng.randint(100, CANVAS_HEIGHT - 100)
         for d in range(18):
             dx, dy = direction_to_dxdy(d * 20)
 
-            enemy = Enemy(space_game, x, y, dx * ENEMY_BASE_SPEED,
-                          dy * ENEMY_BASE_SPEED)
+            enemy = space_game.spawn(Enemy, x, y, dx * ENEMY_BASE_SPEED,
+                                     dy * ENEMY_BASE_SPEED)
             enemies.append(enemy)
 
         return enemies
@@ -77,7 +92,7 @@ class TieFighterEnemyGeration(EnemyGenerationStrategy):
         vx *= ENEMY_BASE_SPEED
         vy *= ENEMY_BASE_SPEED
 
-        enemy = TieFighter(space_game, x, y, vx, vy)
+        enemy = space_game.spawn(TieFighter, x, y, vx, vy)
         return [enemy]
 
 
@@ -89,93 +104,148 @@ class EdgeEnemyGenerationStrategy(EnemyGenerationStrategy):
         vx *= ENEMY_BASE_SPEED
         vy *= ENEMY_BASE_SPEED
 
-        enemy = Enemy(space_game, x, y, vx, vy)
+        enemy = space_game.spawn(Enemy, x, y, vx, vy)
         return [enemy]
 
 
 class SpaceGame(GameApp):
     def init_game(self):
+        self.entity_store = EntityStore() if USE_ENTITY_STORE else None
+        self.init_pools()
+
         self.background = Sprite(
             self, "images/background.png", CANVAS_WIDTH//2, CANVAS_HEIGHT//2)
         self.ship = Ship(self, CANVAS_WIDTH // 2, CANVAS_HEIGHT // 2)
+        self.explosions = ExplosionManager(self)
 
         self.level = StatusWithText(
-            self, 100, CANVAS_WIDTH-CANVAS_WIDTH*0.3, 'level: %d', 1)
+            self, 100, CANVAS_WIDTH-CANVAS_WIDTH*0.3, 'level: %d', 1, HUD_SLOW_REFRESH)
 
         self.score_wait = 0
         self.score = StatusWithText(self, 100, 20, 'Score: %d', 0)
         self.enemy_creation_strategies = [
-            [0.09, TieFighterEnemyGeration()],
-            [0.03, StarEnemyGenerationStrategy()],
-            [0.8, EdgeEnemyGenerationStrategy()]
+            [prob, strategy] for prob, strategy in zip(ENEMY_STRATEGY_PROBS, (
+                TieFighterEnemyGeration(),
+                StarEnemyGenerationStrategy(),
+                EdgeEnemyGenerationStrategy()))
         ]
+        self.levels = LEVELS
+        self.boss_score = BOSS_SCORE
         self.bomb_power = StatusWithText(
             self, CANVAS_WIDTH-100, 20, 'power: %d', BOMB_FULL_POWER)
         self.bomb_wait = 0
+        self.bomb_list = []
         self.bomb_power_text = Text(self, '', 700, 20)
         self.health = StatusWithText(
             self, 700, CANVAS_WIDTH-CANVAS_WIDTH*0.3, 'health: %d', 4)
         self.elements.append(self.ship)
         self.boss = None
-        self.turbo_power()
+        self.scheduler.every(TURBO_DRAIN_INTERVAL, self.turbo_power)
         self.enemies = []
         self.bullets = []
+        self.enemy_grid = SpatialHash(SPATIAL_CELL_SIZE)
+        self.max_enemy_step = 0
+        self.rewind = None
         self.init_key_handlers()
 
+    def init_pools(self):
+        self.pools = {}
+        for cls in (Bullet, TieBullet, Laser, Enemy, TieFighter):
+            self.pools[cls] = ElementPool(partial(cls, self), POOL_SIZES[cls.__name__])
+
+    def spawn(self, cls, x, y, vx, vy):
+        return self.pools[cls].acquire(x, y, vx, vy)
+
+    def pool_report(self):
+        return {cls.__name__: pool.occupancy() for cls, pool in self.pools.items()}
+
     def init_key_handlers(self):
-        key_pressed_handler = ShipMovementKeyPressedHandler(self, self.ship)
-        key_pressed_handler = BombKeyPressedHandler(
+        for keysym, bit in KEY_BINDINGS.items():
+            self.keys.bind(keysym, bit)
+        self.next_fire_tick = 0
+        self.tapped = 0
+
+        key_pressed_handler = KeyStatePressedHandler(self, self.ship)
+        key_pressed_handler = RewindKeyPressedHandler(
+            self, self.ship, key_pressed_handler)
+        key_pressed_handler = PerfOverlayKeyPressedHandler(
             self, self.ship, key_pressed_handler)
         self.key_pressed_handler = key_pressed_handler
 
-        key_released_handler = ShipMovementKeyReleasedHandler(self, self.ship)
+        key_released_handler = KeyStateReleasedHandler(self, self.ship)
         self.key_released_handler = key_released_handler
 
+    def apply_input(self):
+        down, pressed, released = self.keys.sample()
+        # a key tapped between two ticks acts for this tick and is released
+        # in the next one, so a tap turns or boosts like a short hold
+        taps = pressed & released
+        released = (released & ~taps) | (self.tapped & ~down)
+        self.tapped = taps
+        ship = self.ship
+        if pressed & KEY_TURBO:
+            ship.turbo = True
+        if released & KEY_TURBO:
+            ship.turbo = False
+        if pressed & KEY_LEFT:
+            ship.start_turn('LEFT')
+        elif pressed & KEY_RIGHT:
+            ship.start_turn('RIGHT')
+        if released & KEY_LEFT:
+            ship.stop_turn('LEFT')
+        if released & KEY_RIGHT:
+            ship.stop_turn('RIGHT')
+        if down & KEY_FIRE and self.tick >= self.next_fire_tick:
+            ship.fire()
+            self.next_fire_tick = self.tick + FIRE_COOLDOWN_TICKS
+        if pressed & KEY_BOMB:
+            self.bomb()
+
     def deathstar_fire(self, delay=0):
 
         if self.boss.in_screen:
             self.boss.start_fire_dir_ship(self.ship.x, self.ship.y)
         if delay <= 200:
-            self.after(100, lambda: self.deathstar_fire(delay+1))
+            self.scheduler.schedule(
+                100, self.deathstar_fire, delay+1, owner=self.boss)
         else:
-            delay = 0
-            self.after(5000, lambda: self.deathstar_fire(delay))
+            self.scheduler.schedule(
+                5000, self.deathstar_fire, 0, owner=self.boss)
 
     def level_stage(self):
-        if self.score.value >= 400 and self.boss == None:
+        if self.score.value >= self.boss_score and self.boss == None:
             self.boss = DeathStar(self)
-            self.boss.come_in()
-            self.deathstar_fire()
-        if self.score.value >= 300:
-            self.level.value = 5
-            self.enemy_creation_strategies[0][0] = 1
-            self.enemy_creation_strategies[1][0] = 0
-            self.enemy_creation_strategies[2][0] = 0
-        elif self.score.value >= 200:
-            self.level.value = 4
-            self.enemy_creation_strategies[1][0] = 0.05
-        elif self.score.value >= 100:
-            self.level.value = 3
-            self.enemy_creation_strategies[0][0] = 0.15
-        elif self.score.value >= 10:
-            self.level.value = 2
-            self.enemy_creation_strategies[2][0] = 1
+            self.boss.come_in(self.deathstar_fire)
+        for threshold, level, probs in self.levels:
+            if self.score.value >= threshold:
+                self.level.value = level
+                for index, prob in probs.items():
+                    self.enemy_creation_strategies[index][0] = prob
+                break
 
     def create_enemies(self):
-        p = random()
-        for prob, strategy in self.enemy_creation_strategies:
+        p = rng.random()
+        for index, (prob, strategy) in enumerate(self.enemy_creation_strategies):
             if p < prob:
                 enemies = strategy.generate(self, self.ship)
                 for e in enemies:
                     self.add_enemy(e)
+                self.telemetry.record(EVENT_SPAWN, self.tick, index, len(enemies))
 
     def add_enemy(self, enemy):
+        if self.governor.sheds(SHED_ENTITIES) and len(self.enemies) >= GOVERNOR_ENEMY_CAP:
+            enemy.delete()
+            return
         self.enemies.append(enemy)
+        if self.entity_store is None:
+            self.enemy_grid.insert(enemy)
 
     def add_bullet(self, bullet):
         if self.bomb_power.value > 0:
             self.bomb_power.value -= 1
             self.bullets.append(bullet)
+        else:
+            bullet.delete()
 
     def bullet_count(self):
         return len(self.bullets)
@@ -183,31 +253,32 @@ class SpaceGame(GameApp):
     def animate_bomb(self, i):
         if len(self.bomb_list) > 0:
             self.canvas.delete(self.bomb_list[-1])
-            if i == 10:
-                return
+        # a restored timer arrives with an empty bomb_list, so the last step
+        # has to end the ring on its own
+        if i >= 10:
+            return
         bomb = 0+BOMB_RADIUS*(i*0.1)
         self.bomb_list.append(self.canvas.create_oval(
             self.ship.x - bomb,
             self.ship.y - bomb,
             self.ship.x + bomb,
             self.ship.y + bomb, fill="#CCFFFF"))
-        self.after(50, lambda: self.animate_bomb(i+1))
+        self.scheduler.schedule(50, self.animate_bomb, i+1)
 
     def bomb(self):
         if self.bomb_power.value == BOMB_FULL_POWER:
             self.bomb_power.value = 0
             self.bomb_list = []
             self.animate_bomb(0)
-            for e in self.enemies:
-                if self.ship.distance_to(e) <= BOMB_RADIUS:
-                    if isinstance(e, TieFighter):
-                        explode = Explode(self, e.x, e.y, 200)
-                        explode.update()
-                    else:
-                        explode = Explode(self, e.x, e.y, 50)
-                        explode.update()
-                    self.score.value += 1
-                    e.to_be_deleted = True
+            kills = self.enemies_within(self.ship.x, self.ship.y, BOMB_RADIUS)
+            for e in kills:
+                if isinstance(e, TieFighter):
+                    self.explosions.spawn(e.x, e.y, 200)
+                else:
+                    self.explosions.spawn(e.x, e.y, 50)
+                self.score.value += 1
+                e.to_be_deleted = True
+            self.telemetry.record(EVENT_BOMB, self.tick, len(kills), self.score.value)
 
     def update_level_text(self):
         self.level.value += 1
@@ -228,7 +299,11 @@ class SpaceGame(GameApp):
             self.bomb_power.value += 1
 
     def pre_update(self):
-        if random() < 0.1:
+        self.apply_input()
+        chance = ENEMY_SPAWN_CHANCE
+        if self.governor.sheds(SHED_SPAWNS):
+            chance *= GOVERNOR_SPAWN_SCALE
+        if rng.random() < chance:
             self.create_enemies()
 
     def turbo_power(self):
@@ -236,70 +311,292 @@ class SpaceGame(GameApp):
             self.ship.turbo = False
         if self.ship.turbo == True and self.bomb_power.value > 0:
             self.bomb_power.value -= 1
-        self.after(50, self.turbo_power)
 
-    def process_bullet_enemy_collisions(self):
-        for b in self.bullets:
-            for e in self.enemies:
-                if b.is_colliding_with_enemy(e):
-                    if isinstance(e, TieFighter):
-                        explode = Explode(self, e.x, e.y, 200)
-                        explode.update()
-                    else:
-                        explode = Explode(self, e.x, e.y, 50)
-                        explode.update()
-                    self.score.value += 1
-                    b.to_be_deleted = True
-                    e.to_be_deleted = True
+    def enemies_within(self, x, y, r):
+        if self.entity_store is not None:
+            return self.entity_store.within_radius(self.enemies, x, y, r)
+        return self.enemy_grid.query_radius(x, y, r)
 
-    def process_ship_enemy_collision(self):
+    def bullet_enemy_pairs(self):
+        if self.entity_store is not None:
+            return self.entity_store.swept_pairs(self.bullets, self.enemies)
+
+        r = BULLET_ENEMY_HIT_RADIUS
+        pairs = []
+        for b in self.bullets:
+            reach = r + abs(b.x - b.prev_x) + abs(b.y - b.prev_y) + self.max_enemy_step
+            for e in self.enemy_grid.query_radius(b.x, b.y, reach):
+                if segment_within(b.prev_x - e.prev_x, b.prev_y - e.prev_y,
+                                  b.x - e.x, b.y - e.y, r):
+                    pairs.append((b, e))
+        return pairs
+
+    def enemies_hitting_ship(self):
+        ship = self.ship
+        r = SHIP_ENEMY_HIT_RADIUS
+        if self.entity_store is not None:
+            return self.entity_store.swept_within(
+                self.enemies, ship.prev_x, ship.prev_y, ship.x, ship.y, r)
+
+        reach = r + abs(ship.x - ship.prev_x) + abs(ship.y - ship.prev_y) + self.max_enemy_step
+        return [e for e in self.enemy_grid.query_radius(ship.x, ship.y, reach)
+                if segment_within(ship.prev_x - e.prev_x, ship.prev_y - e.prev_y,
+                                  ship.x - e.x, ship.y - e.y, r)]
+
+    def update_max_enemy_step(self):
+        step = 0
         for e in self.enemies:
+            s = abs(e.vx) + abs(e.vy)
+            if s > step:
+                step = s
+        self.max_enemy_step = step
 
-            if self.ship.is_colliding_with_enemy(e):
-                self.health.value -= 1
-                self.ship_got_hit(50)
-                e.to_be_deleted = True
-                if self.health.value == 0 or isinstance(e, TieFighter):
-                    self.health.value = 0
-                    self.ship_got_hit(200)
-                    self.ship.delete()
-                    self.stop_animation()
+    def process_bullet_enemy_collisions(self):
+        for b, e in self.bullet_enemy_pairs():
+            if isinstance(e, TieFighter):
+                self.explosions.spawn(e.x, e.y, 200)
+            else:
+                self.explosions.spawn(e.x, e.y, 50)
+            self.score.value += 1
+            b.to_be_deleted = True
+            e.to_be_deleted = True
+            self.telemetry.record(EVENT_KILL, self.tick, isinstance(e, TieFighter),
+                                  self.score.value)
+
+    def process_ship_enemy_collision(self):
+        hits = self.enemies_hitting_ship()
+        for e in hits:
+            self.health.value -= 1
+            self.ship_got_hit(50)
+            e.to_be_deleted = True
+            fatal = self.health.value == 0 or isinstance(e, TieFighter)
+            self.telemetry.record(EVENT_SHIP_HIT, self.tick, self.health.value, fatal)
+            if fatal:
+                self.health.value = 0
+                self.ship_got_hit(200)
+                self.ship.delete()
+                self.stop_animation()
+        if hits:
+            for e in hits:
+                e.delete()
+            self.enemies = [e for e in self.enemies if not e.to_be_deleted]
+            if self.entity_store is None:
+                self.enemy_grid.rebuild(self.enemies)
 
     def process_collisions(self):
         self.process_bullet_enemy_collisions()
-        self.process_ship_enemy_collision()
 
     def ship_got_hit(self, size):
-        explode = Explode(self, self.ship.x, self.ship.y, size)
-        explode.update()
+        self.explosions.spawn(self.ship.x, self.ship.y, size)
 
     def update_and_filter_deleted(self, elements):
         new_list = []
         for e in elements:
             e.update()
-            e.render()
             if e.to_be_deleted:
                 e.delete()
             else:
                 new_list.append(e)
         return new_list
 
+    def render_elements(self, elements):
+        for e in elements:
+            e.render()
+
+    def enable_rewind(self, seconds=REWIND_SECONDS):
+        self.rewind = RewindBuffer(seconds, self.update_delay)
+
+    def rewind_by(self, seconds):
+        if self.rewind is None:
+            return
+        data = self.rewind.rewind(int(seconds * 1000 / self.update_delay))
+        if data is None:
+            return
+        restore_snapshot(self, data)
+        if self.recorder is not None:
+            self.recorder.truncate(self.tick)
+
+    def outcome(self):
+        return {
+            'tick': self.tick,
+            'score': self.score.value,
+            'health': self.health.value,
+            'bomb_power': self.bomb_power.value,
+        }
+
+    def entities(self):
+        return self.elements + self.enemies + self.bullets
+
+    def perf_counts(self):
+        return {
+            'enemies': len(self.enemies),
+            'bullets': len(self.bullets),
+        }
+
+    def update_effects(self):
+        self.explosions.update(self.update_delay)
+
     def post_update(self):
+        perf = self.perf
+        t = perf.start()
         self.process_collisions()
+        t = perf.lap('process_collisions', t)
+
         self.level_stage()
+        if self.entity_store is not None:
+            self.entity_store.integrate()
+            self.entity_store.cull(CANVAS_WIDTH, CANVAS_HEIGHT)
         self.bullets = self.update_and_filter_deleted(self.bullets)
         self.enemies = self.update_and_filter_deleted(self.enemies)
+        if self.entity_store is None:
+            self.enemy_grid.rebuild(self.enemies)
+            self.update_max_enemy_step()
+        # the ship moved earlier this tick, so test it once the enemies have
+        # made their move too and both swept paths cover the same tick
+        self.process_ship_enemy_collision()
+        t = perf.lap('update_and_filter_deleted', t)
+
+        self.render_elements(self.bullets)
+        self.render_elements(self.enemies)
+        perf.lap('render', t)
 
         self.update_score()
         self.update_bomb_power()
 
+        if self.rewind is not None and not self.is_stopped:
+            self.rewind.push(take_snapshot(self))
+
+
+def run_headless(ticks, replayer=None, memory_report=False, telemetry=None,
+                 telemetry_binary=False, backend='canvas'):
+    app = SpaceGame(None, CANVAS_WIDTH, CANVAS_HEIGHT, UPDATE_DELAY, headless=True,
+                    backend=backend)
+    app.replayer = replayer
+    if memory_report:
+        app.memory.enable()
+    if telemetry:
+        app.telemetry.open(telemetry, binary=telemetry_binary)
+    start = time.perf_counter()
+    ran = app.run_headless(ticks)
+    elapsed = time.perf_counter() - start
+    print("ticks: %d  score: %d  time: %.2fs  ticks/s: %.0f" %
+          (ran, app.score.value, elapsed, ran / elapsed if elapsed else 0))
+    if telemetry:
+        app.telemetry.close()
+        print("telemetry: %d records written, %d dropped" % (
+            app.telemetry.written, app.telemetry.dropped))
+    for name, occupancy in app.pool_report().items():
+        print("pool %s: in use %d, free %d/%d, created %d, reused %d" % (
+            name, occupancy['in_use'], occupancy['free'], occupancy['size'],
+            occupancy['created'], occupancy['reused']))
+    if memory_report:
+        print_memory_report(app.memory_report())
+    return app
+
+
+def print_memory_report(report):
+    for name, stats in sorted(report['entities'].items()):
+        print("%-12s %5d entities  %8d bytes  %6.1f bytes each" % (
+            name, stats['count'], stats['bytes'], stats['bytes_each']))
+    print("traced: %d bytes (peak %d)  growth per frame: mean %.1f, max %d bytes" % (
+        report['traced_bytes'], report['traced_peak_bytes'],
+        report['growth_per_frame_mean'], report['growth_per_frame_max']))
+
+
+def check_replay(app, recording):
+    expected = recording['outcome']
+    if expected is None:
+        return True
+    actual = app.outcome()
+    if actual != expected:
+        print("replay diverged: expected %r, got %r" % (expected, actual))
+        return False
+    print("replay matches the recorded outcome")
+    return True
+
 
 if __name__ == "__main__":
-    root = tk.Tk()
-    root.title("Space Fighter")
-
-    # do not allow window resizing
-    root.resizable(False, False)
-    app = SpaceGame(root, CANVAS_WIDTH, CANVAS_HEIGHT, UPDATE_DELAY)
-    app.start()
-    root.mainloop()
+    parser = argparse.ArgumentParser(description="Space Fighter")
+    parser.add_argument('--headless', action='store_true',
+                        help="run the simulation without a display")
+    parser.add_argument('--ticks', type=int, default=10000,
+                        help="number of ticks to simulate in headless mode")
+    parser.add_argument('--seed', type=int,
+                        help="seed for the game's random number generator")
+    parser.add_argument('--record', metavar='PATH',
+                        help="record keyboard input and the seed to PATH")
+    parser.add_argument('--replay', metavar='PATH',
+                        help="replay a recording made with --record")
+    parser.add_argument('--fast', action='store_true',
+                        help="replay as fast as possible without a display")
+    parser.add_argument('--split', action='store_true',
+                        help="run the game logic in a worker process and only draw in this one")
+    parser.add_argument('--telemetry', metavar='DIR',
+                        help="write per-tick metrics and game events to rotating files in DIR")
+    parser.add_argument('--telemetry-binary', action='store_true',
+                        help="write telemetry as packed binary records instead of NDJSON")
+    parser.add_argument('--backend', choices=('canvas', 'composite'), default='canvas',
+                        help="draw every sprite as a canvas item, or blend them into "
+                             "one frame image per tick")
+    parser.add_argument('--memory-report', action='store_true',
+                        help="trace memory and print per-entity and per-frame usage")
+    args = parser.parse_args()
+
+    seed = args.seed
+    recording = None
+    replayer = None
+    if args.replay:
+        recording = load_recording(args.replay)
+        seed = recording['seed']
+        replayer = InputReplayer(recording['events'])
+    if seed is None:
+        seed = random.randrange(2**32)
+    seed_rng(seed)
+
+    if recording is not None and (args.fast or args.headless):
+        ticks = recording['outcome']['tick'] if recording['outcome'] else args.ticks
+        app = run_headless(ticks, replayer)
+        sys.exit(0 if check_replay(app, recording) else 1)
+    elif args.headless:
+        run_headless(args.ticks, memory_report=args.memory_report,
+                     telemetry=args.telemetry, telemetry_binary=args.telemetry_binary,
+                     backend=args.backend)
+    elif args.split:
+        from splitmode import run_split
+        run_split(seed)
+    else:
+        root = tk.Tk()
+        root.title("Space Fighter")
+
+        # do not allow window resizing
+        root.resizable(False, False)
+
+        sprite_cache.bundle = load_bundle()
+        decoder = ThreadPoolExecutor(max_workers=ASSET_DECODE_WORKERS)
+        sprite_cache.preload(image_files('images'), decoder)
+        decoder.shutdown(wait=False)
+
+        app = SpaceGame(root, CANVAS_WIDTH, CANVAS_HEIGHT, UPDATE_DELAY, backend=args.backend)
+        if recording is not None:
+            app.replayer = replayer
+            if recording['outcome']:
+                app.max_ticks = recording['outcome']['tick']
+        if args.record:
+            app.recorder = InputRecorder(seed, UPDATE_DELAY)
+        if recording is None:
+            app.enable_rewind()
+        if args.memory_report:
+            app.memory.enable()
+        if args.telemetry:
+            app.telemetry.open(args.telemetry, binary=args.telemetry_binary)
+        app.start()
+        root.mainloop()
+        app.telemetry.close()
+
+        if args.memory_report:
+            print_memory_report(app.memory_report())
+
+        if args.record:
+            app.recorder.save(args.record, app.outcome())
+        if recording is not None:
+            check_replay(app, recording)
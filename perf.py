@@ -0,0 +1,133 @@
+import sys
+import time
+import tracemalloc
+from collections import deque
+
+from consts import PERF_WINDOW
+
+
+def percentile(values, p):
+    if not values:
+        return 0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+class PerfMonitor:
+    def __init__(self, window=PERF_WINDOW):
+        self.window = window
+        self.enabled = False
+        self.frame_times = deque(maxlen=window)
+        self.frame_starts = deque(maxlen=window)
+        self.phases = {}
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+        self.frame_times.clear()
+        self.frame_starts.clear()
+        self.phases.clear()
+
+    def start(self):
+        if not self.enabled:
+            return 0
+        return time.perf_counter()
+
+    def lap(self, name, start):
+        if not self.enabled:
+            return 0
+        now = time.perf_counter()
+        phase = self.phases.get(name)
+        if phase is None:
+            phase = self.phases[name] = deque(maxlen=self.window)
+        phase.append(now - start)
+        return now
+
+    def end_frame(self, start):
+        if not self.enabled:
+            return
+        self.frame_starts.append(start)
+        self.frame_times.append(time.perf_counter() - start)
+
+    def frame_stats(self):
+        times = self.frame_times
+        if not times:
+            return (0, 0, 0)
+        return (percentile(times, 0.5) * 1000,
+                percentile(times, 0.95) * 1000,
+                max(times) * 1000)
+
+    def tick_rate(self):
+        starts = self.frame_starts
+        if len(starts) < 2 or starts[-1] == starts[0]:
+            return 0
+        return (len(starts) - 1) / (starts[-1] - starts[0])
+
+    def phase_ms(self, name):
+        phase = self.phases.get(name)
+        if not phase:
+            return 0
+        return sum(phase) / len(phase) * 1000
+
+
+def object_bytes(obj):
+    size = sys.getsizeof(obj)
+    if hasattr(obj, '__dict__'):
+        size += sys.getsizeof(obj.__dict__)
+    return size
+
+
+class MemoryReport:
+    def __init__(self, window=PERF_WINDOW):
+        self.enabled = False
+        self.started_tracing = False
+        self.growth = deque(maxlen=window)
+        self.last = 0
+
+    def enable(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracing = True
+        self.enabled = True
+        self.last = tracemalloc.get_traced_memory()[0]
+
+    def disable(self):
+        self.enabled = False
+        self.growth.clear()
+        # leave tracing alone if someone else started it
+        if self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
+
+    def end_frame(self):
+        if not self.enabled:
+            return
+        current = tracemalloc.get_traced_memory()[0]
+        self.growth.append(current - self.last)
+        self.last = current
+
+    def entity_bytes(self, entities):
+        by_type = {}
+        for entity in entities:
+            name = type(entity).__name__
+            stats = by_type.get(name)
+            if stats is None:
+                stats = by_type[name] = {'count': 0, 'bytes': 0}
+            stats['count'] += 1
+            stats['bytes'] += object_bytes(entity)
+        for stats in by_type.values():
+            stats['bytes_each'] = stats['bytes'] / stats['count']
+        return by_type
+
+    def report(self, entities):
+        current, peak = tracemalloc.get_traced_memory()
+        growth = self.growth
+        return {
+            'entities': self.entity_bytes(entities),
+            'traced_bytes': current,
+            'traced_peak_bytes': peak,
+            'growth_per_frame_mean': sum(growth) / len(growth) if growth else 0,
+            'growth_per_frame_max': max(growth) if growth else 0,
+        }
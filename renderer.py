@@ -0,0 +1,71 @@
+import re
+
+TCL_SPECIAL = re.compile(r'[\\{}\[\]"$;\s]')
+TCL_ESCAPES = {'\n': '\\n', '\t': '\\t', '\r': '\\r'}
+
+
+def tcl_quote(value):
+    # backslash every character Tcl would substitute or split a word on,
+    # so any option value stays a single literal word
+    value = str(value)
+    if not value:
+        return '{}'
+    return TCL_SPECIAL.sub(
+        lambda match: TCL_ESCAPES.get(match.group(), '\\' + match.group()), value)
+
+
+class BatchRenderer:
+    def __init__(self, canvas):
+        self.canvas = canvas
+        self.moves = {}
+        self.options = {}
+        self.raised = []
+        self.tcl_calls = 0
+        self.changes = 0
+        self.total_tcl_calls = 0
+
+    def move(self, item, x, y):
+        self.moves[item] = (x, y)
+
+    def configure(self, item, **options):
+        pending = self.options.get(item)
+        if pending is None:
+            self.options[item] = options
+        else:
+            pending.update(options)
+
+    def raise_item(self, item):
+        self.raised.append(item)
+
+    def discard(self, item):
+        self.moves.pop(item, None)
+        self.options.pop(item, None)
+
+    def script(self):
+        widget = self.canvas._w
+        lines = ['%s coords %d %.2f %.2f' % (widget, item, x, y)
+                 for item, (x, y) in self.moves.items()]
+        for item, options in self.options.items():
+            lines.append('%s itemconfigure %d %s' % (widget, item, ' '.join(
+                '-%s %s' % (name, tcl_quote(value)) for name, value in options.items())))
+        for item in self.raised:
+            lines.append('%s raise %d' % (widget, item))
+        return '\n'.join(lines)
+
+    def flush(self):
+        self.changes = len(self.moves) + len(self.options) + len(self.raised)
+        if not self.changes:
+            self.tcl_calls = 0
+            return
+
+        apply_batch = getattr(self.canvas, 'apply_batch', None)
+        if apply_batch is not None:
+            apply_batch(self.moves, self.options, self.raised)
+        else:
+            self.canvas.tk.eval(self.script())
+        self.tcl_calls = 1
+        self.total_tcl_calls += 1
+
+        self.moves = {}
+        self.options = {}
+        self.raised = []
@@ -0,0 +1,57 @@
+import json
+from collections import deque, namedtuple
+
+KeyEvent = namedtuple('KeyEvent', ['keysym', 'char'])
+
+RECORDING_VERSION = 1
+
+
+class InputRecorder:
+    def __init__(self, seed, update_delay):
+        self.seed = seed
+        self.update_delay = update_delay
+        self.events = []
+
+    def record(self, tick, kind, event):
+        self.events.append([tick, kind, event.keysym, event.char])
+
+    def truncate(self, tick):
+        # events recorded at tick t are applied in tick t + 1
+        self.events = [event for event in self.events if event[0] < tick]
+
+    def save(self, path, outcome=None):
+        recording = {
+            'version': RECORDING_VERSION,
+            'seed': self.seed,
+            'update_delay': self.update_delay,
+            'events': self.events,
+            'outcome': outcome,
+        }
+        with open(path, 'w') as f:
+            json.dump(recording, f)
+
+
+def load_recording(path):
+    with open(path) as f:
+        recording = json.load(f)
+    if recording.get('version') != RECORDING_VERSION:
+        raise ValueError("unsupported recording version: %r" % recording.get('version'))
+    return recording
+
+
+class InputReplayer:
+    def __init__(self, events):
+        self.events = deque(events)
+
+    def apply(self, app):
+        events = self.events
+        while events and events[0][0] <= app.tick:
+            tick, kind, keysym, char = events.popleft()
+            event = KeyEvent(keysym, char)
+            if kind == 'press':
+                app.key_pressed_handler.handle(event)
+            else:
+                app.key_released_handler.handle(event)
+
+    def is_finished(self):
+        return not self.events
@@ -0,0 +1,72 @@
+import heapq
+import time
+from itertools import count
+
+
+class Timer:
+    def __init__(self, due, func, args, owner=None, interval=None):
+        self.due = due
+        self.func = func
+        self.args = args
+        self.owner = owner
+        self.interval = interval
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class Scheduler:
+    def __init__(self):
+        self.now = 0
+        self.queue = []
+        self.seq = count()
+        self.owned = {}
+        self.dispatched = 0
+        self.dispatch_time = 0.0
+
+    def push(self, timer):
+        heapq.heappush(self.queue, (timer.due, next(self.seq), timer))
+
+    def schedule(self, delay, func, *args, owner=None, interval=None):
+        timer = Timer(self.now + delay, func, args, owner, interval)
+        self.push(timer)
+        if owner is not None:
+            self.owned.setdefault(owner, set()).add(timer)
+        return timer
+
+    def every(self, interval, func, *args, owner=None):
+        return self.schedule(interval, func, *args, owner=owner, interval=interval)
+
+    def cancel_owner(self, owner):
+        timers = self.owned.pop(owner, None)
+        if timers:
+            for timer in timers:
+                timer.cancel()
+
+    def advance(self, dt):
+        start = time.perf_counter()
+        self.now += dt
+        queue = self.queue
+        dispatched = 0
+        while queue and queue[0][0] <= self.now:
+            due, _, timer = heapq.heappop(queue)
+            if timer.cancelled:
+                continue
+            if timer.interval:
+                timer.due = due + timer.interval
+                self.push(timer)
+            elif timer.owner is not None:
+                timers = self.owned.get(timer.owner)
+                if timers is not None:
+                    timers.discard(timer)
+                    if not timers:
+                        del self.owned[timer.owner]
+            timer.func(*timer.args)
+            dispatched += 1
+
+        self.dispatched = dispatched
+        self.dispatch_time = time.perf_counter() - start
+
+    def pending(self):
+        return sum(1 for _, _, timer in self.queue if not timer.cancelled)
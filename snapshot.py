@@ -0,0 +1,316 @@
+import struct
+
+from consts import *
+from elements import Bullet, TieBullet, Laser, Enemy, TieFighter, DeathStar
+from utils import rng
+
+MAGIC = b'SFSN'
+SNAPSHOT_VERSION = 3
+
+# the index of a class here is its kind on disk; append, never reorder
+KINDS = (Bullet, TieBullet, Laser, Enemy, TieFighter)
+KIND_OF = {cls: kind for kind, cls in enumerate(KINDS)}
+
+# timer callbacks are stored by method name and the object they are bound to
+TIMER_METHODS = ('turbo_power', 'animate_bomb', 'deathstar_fire', 'fire')
+TIMER_METHOD_OF = {name: index for index, name in enumerate(TIMER_METHODS)}
+TARGET_GAME, TARGET_BOSS, TARGET_ENEMY = range(3)
+
+# magic, version, tick, scheduler time, score, score wait, health, bomb power,
+# bomb wait, level, next fire tick, held/latched/down/tapped keys, has boss,
+# bullet, enemy, timer and explosion counts
+HEADER = struct.Struct('<4sHIqiiiiiiqBBBBBHHHH')
+# rng version, gauss flag, gauss value, then the Mersenne Twister words
+RNG_HEADER = struct.Struct('<iBd')
+RNG_WORDS = struct.Struct('<625I')
+# spawn probability of each enemy creation strategy; levels change them
+STRATEGIES = struct.Struct('<%dd' % len(ENEMY_STRATEGY_PROBS))
+# x, y, prev x, prev y, angle, direction, turbo, turning left, turning right
+SHIP = struct.Struct('<ddddddBBB')
+# x, y, angle, in screen, entry tween steps left
+BOSS = struct.Struct('<dddBi')
+# kind, x, y, vx, vy, prev x, prev y
+ENTITY = struct.Struct('<Bdddddd')
+# method, target, enemy index, due, interval, has argument, argument
+TIMER = struct.Struct('<BBiqiBi')
+# x, y, size, age
+EXPLOSION = struct.Struct('<ddii')
+
+
+def timer_record(game, timer, enemy_index):
+    func = timer.func
+    method = TIMER_METHOD_OF.get(getattr(func, '__name__', None))
+    target = getattr(func, '__self__', None)
+    if method is None or target is None:
+        raise ValueError("cannot snapshot timer %r" % (func,))
+
+    if target is game:
+        kind, index = TARGET_GAME, -1
+    elif target is game.boss:
+        kind, index = TARGET_BOSS, -1
+    elif id(target) in enemy_index:
+        kind, index = TARGET_ENEMY, enemy_index[id(target)]
+    else:
+        raise ValueError("cannot snapshot timer %r" % (func,))
+
+    arg = timer.args[0] if timer.args else 0
+    return TIMER.pack(method, kind, index, timer.due, timer.interval or 0,
+                      len(timer.args), arg)
+
+
+def boss_tween(game):
+    for tween in game.tweens:
+        if tween.element is game.boss and not tween.is_done:
+            return tween
+    return None
+
+
+def take_snapshot(game):
+    ship = game.ship
+    boss = game.boss
+    keys = game.keys
+    timers = sorted((due, seq, timer) for due, seq, timer in game.scheduler.queue
+                    if not timer.cancelled)
+    enemy_index = {id(e): index for index, e in enumerate(game.enemies)}
+    explosions = game.explosions.explosions
+
+    parts = [HEADER.pack(
+        MAGIC, SNAPSHOT_VERSION, game.tick, game.scheduler.now,
+        game.score.value, game.score_wait, game.health.value, game.bomb_power.value,
+        game.bomb_wait, game.level.value, game.next_fire_tick,
+        keys.held, keys.latched, keys.down, game.tapped, boss is not None,
+        len(game.bullets), len(game.enemies), len(timers), len(explosions))]
+
+    version, words, gauss = rng.getstate()
+    parts.append(RNG_HEADER.pack(version, gauss is not None, gauss or 0))
+    parts.append(RNG_WORDS.pack(*words))
+    parts.append(STRATEGIES.pack(*(prob for prob, _ in game.enemy_creation_strategies)))
+
+    parts.append(SHIP.pack(ship.x, ship.y, ship.prev_x, ship.prev_y, ship.angle,
+                           ship.direction, ship.turbo, ship.is_turning_left,
+                           ship.is_turning_right))
+    if boss is not None:
+        tween = boss_tween(game)
+        parts.append(BOSS.pack(boss.x, boss.y, getattr(boss, 'angle', 0),
+                               boss.in_screen, tween.remaining if tween else 0))
+
+    pack = ENTITY.pack
+    for e in game.bullets:
+        parts.append(pack(KIND_OF[type(e)], e.x, e.y, e.vx, e.vy, e.prev_x, e.prev_y))
+    for e in game.enemies:
+        parts.append(pack(KIND_OF[type(e)], e.x, e.y, e.vx, e.vy, e.prev_x, e.prev_y))
+    for _, _, timer in timers:
+        parts.append(timer_record(game, timer, enemy_index))
+    for explosion in explosions:
+        parts.append(EXPLOSION.pack(explosion.x, explosion.y, explosion.size, explosion.age))
+    return b''.join(parts)
+
+
+def read_entities(game, data, offset, count):
+    entities = []
+    for _ in range(count):
+        kind, x, y, vx, vy, prev_x, prev_y = ENTITY.unpack_from(data, offset)
+        offset += ENTITY.size
+        e = game.spawn(KINDS[kind], x, y, vx, vy)
+        e.prev_x = prev_x
+        e.prev_y = prev_y
+        if e.row is not None:
+            e.store.px[e.row] = prev_x
+            e.store.py[e.row] = prev_y
+        entities.append(e)
+    return entities, offset
+
+
+def restore_snapshot(game, data):
+    (magic, version, tick, now, score, score_wait, health, bomb_power, bomb_wait,
+     level, next_fire_tick, held, latched, down, tapped, has_boss,
+     bullet_count, enemy_count, timer_count, explosion_count) = HEADER.unpack_from(data)
+    if magic != MAGIC or version != SNAPSHOT_VERSION:
+        raise ValueError("not a version %d snapshot" % SNAPSHOT_VERSION)
+    offset = HEADER.size
+
+    rng_version, has_gauss, gauss = RNG_HEADER.unpack_from(data, offset)
+    offset += RNG_HEADER.size
+    words = RNG_WORDS.unpack_from(data, offset)
+    offset += RNG_WORDS.size
+    rng.setstate((rng_version, words, gauss if has_gauss else None))
+    probs = STRATEGIES.unpack_from(data, offset)
+    offset += STRATEGIES.size
+    for strategy, prob in zip(game.enemy_creation_strategies, probs):
+        strategy[0] = prob
+
+    for e in game.bullets + game.enemies:
+        e.delete()
+    for item in game.bomb_list:
+        game.canvas.delete(item)
+    game.bomb_list = []
+    game.tweens = []
+    game.explosions.clear()
+
+    ship = game.ship
+    if game.health.value == 0 and health > 0:
+        # the ship's canvas item was deleted when it died
+        ship.init_canvas_object()
+        ship.drawn_x = ship.x
+        ship.drawn_y = ship.y
+    (ship.x, ship.y, ship.prev_x, ship.prev_y, ship.angle, ship.direction,
+     turbo, left, right) = SHIP.unpack_from(data, offset)
+    offset += SHIP.size
+    ship.turbo = bool(turbo)
+    ship.is_turning_left = bool(left)
+    ship.is_turning_right = bool(right)
+    ship.update_ship()
+    ship.render()
+
+    tween_steps = 0
+    if has_boss:
+        if game.boss is None:
+            game.boss = DeathStar(game)
+        boss = game.boss
+        boss.x, boss.y, boss.angle, in_screen, tween_steps = BOSS.unpack_from(data, offset)
+        offset += BOSS.size
+        boss.in_screen = bool(in_screen)
+        boss.render()
+    elif game.boss is not None:
+        game.boss.delete()
+        game.boss = None
+
+    game.bullets, offset = read_entities(game, data, offset, bullet_count)
+    game.enemies, offset = read_entities(game, data, offset, enemy_count)
+
+    # drop the timers the current state and the respawned enemies scheduled
+    scheduler = game.scheduler
+    scheduler.queue = []
+    scheduler.owned = {}
+    scheduler.now = now
+    for _ in range(timer_count):
+        method, target, index, due, interval, has_arg, arg = TIMER.unpack_from(data, offset)
+        offset += TIMER.size
+        owner = None
+        if target == TARGET_GAME:
+            obj = game
+        elif target == TARGET_BOSS:
+            obj = owner = game.boss
+        else:
+            obj = owner = game.enemies[index]
+        args = (arg,) if has_arg else ()
+        scheduler.schedule(due - now, getattr(obj, TIMER_METHODS[method]), *args,
+                           owner=owner, interval=interval or None)
+
+    if tween_steps:
+        tween = game.boss.come_in(game.deathstar_fire)
+        tween.remaining = tween_steps
+        tween.dx = (tween.x - game.boss.x) / tween_steps
+        tween.dy = (tween.y - game.boss.y) / tween_steps
+
+    for _ in range(explosion_count):
+        x, y, size, age = EXPLOSION.unpack_from(data, offset)
+        offset += EXPLOSION.size
+        explosion = game.explosions.spawn(x, y, size)
+        if explosion is not None:
+            explosion.age = age
+
+    game.tick = tick
+    game.score.value = score
+    game.score_wait = score_wait
+    game.health.value = health
+    game.bomb_power.value = bomb_power
+    game.bomb_wait = bomb_wait
+    game.level.value = level
+    game.next_fire_tick = next_fire_tick
+    game.tapped = tapped
+    game.keys.held = held
+    game.keys.latched = latched
+    game.keys.down = down
+
+    if game.entity_store is None:
+        game.enemy_grid.rebuild(game.enemies)
+        game.update_max_enemy_step()
+    game.render_elements(game.bullets)
+    game.render_elements(game.enemies)
+    game.resume_animation()
+
+
+class RewindBuffer:
+    def __init__(self, seconds=REWIND_SECONDS, update_delay=UPDATE_DELAY):
+        self.capacity = max(1, int(seconds * 1000 / update_delay))
+        self.frames = [None] * self.capacity
+        self.head = 0
+        self.count = 0
+        self.bytes = 0
+
+    def push(self, data):
+        old = self.frames[self.head]
+        if old is not None:
+            self.bytes -= len(old)
+        self.frames[self.head] = data
+        self.bytes += len(data)
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def latest(self):
+        if not self.count:
+            return None
+        return self.frames[(self.head - 1) % self.capacity]
+
+    def rewind(self, frames):
+        # drop the newest frames; the oldest snapshot is always kept
+        if not self.count:
+            return None
+        for _ in range(min(frames, self.count - 1)):
+            self.head = (self.head - 1) % self.capacity
+            self.bytes -= len(self.frames[self.head])
+            self.frames[self.head] = None
+            self.count -= 1
+        return self.latest()
+
+    def clear(self):
+        self.frames = [None] * self.capacity
+        self.head = 0
+        self.count = 0
+        self.bytes = 0
+
+
+def pending_timers(game, name):
+    return [timer for _, _, timer in game.scheduler.queue
+            if not timer.cancelled and getattr(timer.func, '__name__', None) == name]
+
+
+def check_bomb_rewind(seed, ticks):
+    # restore snapshots taken at every step of a growing bomb ring; each
+    # ring must finish on schedule instead of being redrawn forever
+    from batch import BatchGame, CircleBot
+    from utils import seed_rng
+
+    seed_rng(seed)
+    game = BatchGame(None, CANVAS_WIDTH, CANVAS_HEIGHT, UPDATE_DELAY, headless=True)
+    game.bot = CircleBot(seed)
+    game.start()
+    snapshots = []
+    while not game.is_stopped and game.tick < ticks:
+        game.clock.run_next()
+        timers = pending_timers(game, 'animate_bomb')
+        if timers:
+            snapshots.append((game.tick, timers[0].args[0], take_snapshot(game)))
+        elif snapshots:
+            break
+    if not snapshots:
+        print("no bomb went off within %d ticks" % ticks)
+        return False
+
+    ok = True
+    for tick, step, data in snapshots:
+        restore_snapshot(game, data)
+        while game.tick < tick + 100 and not game.is_stopped:
+            game.clock.run_next()
+        left = len(pending_timers(game, 'animate_bomb'))
+        ovals = sum(entry[0] == 'oval' for entry in game.canvas.items.values())
+        print("snapshot at tick %d, ring step %d: %d bomb timers and %d rings "
+              "100 ticks after restore" % (tick, step, left, ovals))
+        ok = ok and left == 0 and ovals == 0
+    return ok
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(0 if check_bomb_rewind(1, 5000) else 1)
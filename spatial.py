@@ -0,0 +1,47 @@
+from collections import defaultdict
+
+
+class SpatialHash:
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self.cells = defaultdict(list)
+
+    def cell(self, x, y):
+        return (int(x // self.cell_size), int(y // self.cell_size))
+
+    def clear(self):
+        self.cells.clear()
+
+    def insert(self, element):
+        self.cells[self.cell(element.x, element.y)].append(element)
+
+    def rebuild(self, elements):
+        self.cells.clear()
+        for element in elements:
+            self.insert(element)
+
+    def query_radius(self, x, y, r):
+        cells = self.cells
+        r_sq = r * r
+        min_cx, min_cy = self.cell(x - r, y - r)
+        max_cx, max_cy = self.cell(x + r, y + r)
+
+        found = []
+        for cx in range(min_cx, max_cx + 1):
+            for cy in range(min_cy, max_cy + 1):
+                cell = cells.get((cx, cy))
+                if not cell:
+                    continue
+                for element in cell:
+                    dx = element.x - x
+                    dy = element.y - y
+                    if dx*dx + dy*dy <= r_sq:
+                        found.append(element)
+        return found
+
+    def query_pairs(self, elements, r):
+        pairs = []
+        for element in elements:
+            for other in self.query_radius(element.x, element.y, r):
+                pairs.append((element, other))
+        return pairs
@@ -0,0 +1,321 @@
+import multiprocessing
+import queue
+import struct
+import time
+from multiprocessing import shared_memory
+
+from consts import *
+from gamelib import GameApp, KeyboardHandler, Sprite, StatusWithText, sprite_cache
+from replay import KeyEvent
+
+SHIP, BULLET, TIE_BULLET, LASER, ENEMY, TIE_FIGHTER, DEATHSTAR, EXPLOSION, BOMB = range(9)
+
+KIND_IMAGES = {
+    BULLET: ('images/bullet1.png', None),
+    TIE_BULLET: ('images/bullet2.png', None),
+    LASER: ('images/bullet2.png', (100, 50)),
+    ENEMY: ('images/enemy1.png', None),
+    TIE_FIGHTER: ('images/tie.png', None),
+    DEATHSTAR: ('images/deathstar.png', (500, 500)),
+}
+
+SEQ = struct.Struct('<Q')
+FRONT = struct.Struct('<I')
+FRONT_OFFSET = SEQ.size * 2
+SHM_HEADER_SIZE = FRONT_OFFSET + 8
+
+# tick, score, health, bomb power, level, stopped, record count
+FRAME_HEADER = struct.Struct('<IiiiiII')
+# kind, explosion frame, angle or bomb radius, x, y
+RECORD = struct.Struct('<BBhff')
+FRAME_SIZE = FRAME_HEADER.size + RECORD.size * SPLIT_MAX_RECORDS
+SHM_SIZE = SHM_HEADER_SIZE + FRAME_SIZE * 2
+
+
+class SnapshotWriter:
+    def __init__(self, buf):
+        self.buf = buf
+        self.front = 0
+
+    def publish(self, header, records):
+        buf = self.buf
+        back = 1 - self.front
+        seq_offset = back * SEQ.size
+        seq = SEQ.unpack_from(buf, seq_offset)[0] + 1
+        SEQ.pack_into(buf, seq_offset, seq)
+
+        records = records[:SPLIT_MAX_RECORDS]
+        base = SHM_HEADER_SIZE + back * FRAME_SIZE
+        FRAME_HEADER.pack_into(buf, base, *header, len(records))
+        offset = base + FRAME_HEADER.size
+        for record in records:
+            RECORD.pack_into(buf, offset, *record)
+            offset += RECORD.size
+
+        SEQ.pack_into(buf, seq_offset, seq + 1)
+        FRONT.pack_into(buf, FRONT_OFFSET, back)
+        self.front = back
+
+
+class SnapshotReader:
+    def __init__(self, buf):
+        self.buf = buf
+
+    def read(self):
+        buf = self.buf
+        while True:
+            front = FRONT.unpack_from(buf, FRONT_OFFSET)[0]
+            seq_offset = front * SEQ.size
+            seq = SEQ.unpack_from(buf, seq_offset)[0]
+            if seq == 0:
+                return None
+            if seq & 1:
+                continue
+
+            base = SHM_HEADER_SIZE + front * FRAME_SIZE
+            header = FRAME_HEADER.unpack_from(buf, base)
+            start = base + FRAME_HEADER.size
+            data = bytes(buf[start:start + header[-1] * RECORD.size])
+
+            if SEQ.unpack_from(buf, seq_offset)[0] == seq:
+                return seq, header, list(RECORD.iter_unpack(data))
+
+
+def snapshot_records(game, kinds):
+    records = []
+    boss = game.boss
+    if boss is not None:
+        records.append((DEATHSTAR, 0, 0, boss.x, boss.y))
+    for e in game.enemies:
+        kind = kinds[type(e)]
+        records.append((kind, 0, round(e.sprite_angle()) % 360, e.x, e.y))
+    for b in game.bullets:
+        records.append((BULLET, 0, round(b.sprite_angle()) % 360, b.x, b.y))
+    if game.ship.canvas_object_id in game.canvas.items:
+        ship = game.ship
+        records.append((SHIP, 0, round(ship.angle) % 360, ship.x, ship.y))
+    for explosion in game.explosions.explosions:
+        records.append((EXPLOSION, explosion.frame, explosion.size,
+                        explosion.x, explosion.y))
+    for item in game.bomb_list:
+        coords = game.canvas.coords(item)
+        if coords:
+            x0, y0, x1, y1 = coords
+            records.append((BOMB, 0, round((x1 - x0) / 2),
+                            (x0 + x1) / 2, (y0 + y1) / 2))
+    return records
+
+
+def run_worker(shm_name, input_queue, stop_event, seed):
+    from main import SpaceGame
+    from elements import Bullet, TieBullet, Laser, Enemy, TieFighter
+    from utils import seed_rng
+
+    kinds = {Bullet: BULLET, TieBullet: TIE_BULLET, Laser: LASER,
+             Enemy: ENEMY, TieFighter: TIE_FIGHTER}
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    writer = SnapshotWriter(shm.buf)
+    seed_rng(seed)
+    game = SpaceGame(None, CANVAS_WIDTH, CANVAS_HEIGHT, UPDATE_DELAY, headless=True)
+    game.start()
+
+    delay = UPDATE_DELAY / 1000
+    deadline = time.perf_counter()
+    try:
+        while not stop_event.is_set():
+            while True:
+                try:
+                    kind, keysym, char = input_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if kind == 'press':
+                    game.key_pressed_handler.handle(KeyEvent(keysym, char))
+                else:
+                    game.key_released_handler.handle(KeyEvent(keysym, char))
+
+            game.clock.run_next()
+            header = (game.tick, game.score.value, game.health.value,
+                      game.bomb_power.value, game.level.value, game.is_stopped)
+            writer.publish(header, snapshot_records(game, kinds))
+
+            deadline += delay
+            remaining = deadline - time.perf_counter()
+            if remaining > 0:
+                time.sleep(remaining)
+            else:
+                deadline = time.perf_counter()
+    finally:
+        del writer
+        shm.close()
+
+
+class ForwardingKeyboardHandler(KeyboardHandler):
+    def __init__(self, input_queue, kind, successor=None):
+        super().__init__(successor)
+        self.input_queue = input_queue
+        self.kind = kind
+
+    def handle(self, event):
+        if event.keysym == 'F3':
+            super().handle(event)
+            return
+        self.input_queue.put((self.kind, event.keysym, event.char))
+
+
+class OverlayKeyboardHandler(KeyboardHandler):
+    def __init__(self, game_app, successor=None):
+        super().__init__(successor)
+        self.game_app = game_app
+
+    def handle(self, event):
+        if event.keysym == 'F3':
+            self.game_app.toggle_perf_overlay()
+        else:
+            super().handle(event)
+
+
+class SnapshotView(GameApp):
+    def __init__(self, parent, reader, input_queue):
+        self.reader = reader
+        self.input_queue = input_queue
+        super().__init__(parent, CANVAS_WIDTH, CANVAS_HEIGHT, UPDATE_DELAY)
+
+    def init_game(self):
+        self.background = Sprite(
+            self, "images/background.png", CANVAS_WIDTH//2, CANVAS_HEIGHT//2)
+        self.ship_atlas = sprite_cache.atlas('images/ship.png', SHIP_TURN_ANGLE)
+        self.explosion_frames = {}
+
+        self.items = []
+        self.item_state = []
+        self.ovals = []
+        self.last_seq = 0
+        self.record_count = 0
+
+        self.level = StatusWithText(
+            self, 100, CANVAS_WIDTH-CANVAS_WIDTH*0.3, 'level: %d', 1, HUD_SLOW_REFRESH)
+        self.score = StatusWithText(self, 100, 20, 'Score: %d', 0)
+        self.bomb_power = StatusWithText(
+            self, CANVAS_WIDTH-100, 20, 'power: %d', BOMB_FULL_POWER)
+        self.health = StatusWithText(
+            self, 700, CANVAS_WIDTH-CANVAS_WIDTH*0.3, 'health: %d', 4)
+        # sprites and bomb rings are created lazily, after the labels, so
+        # each new one is lowered under the first label to keep the HUD on top
+        self.hud_floor = self.level.label_text.canvas_object_id
+
+        self.key_pressed_handler = ForwardingKeyboardHandler(
+            self.input_queue, 'press', OverlayKeyboardHandler(self))
+        self.key_released_handler = ForwardingKeyboardHandler(
+            self.input_queue, 'release')
+
+    def image_for(self, kind, frame, angle):
+        if kind == SHIP:
+            return self.ship_atlas.frame(angle)
+        if kind == EXPLOSION:
+            frames = self.explosion_frames.get(angle)
+            if frames is None:
+                frames = self.explosion_frames[angle] = [
+                    sprite_cache.get("images/explode/%d.png" % (i + 1), (angle, angle))
+                    for i in range(EXPLOSION_FRAMES)]
+            return frames[frame]
+        filename, size = KIND_IMAGES[kind]
+        return sprite_cache.get(filename, size, angle)
+
+    def item(self, index):
+        while index >= len(self.items):
+            # bomb records come last, so sprites stay under the rings too;
+            # new items stack above older ones, which keeps record order
+            item = self.canvas.create_image(0, 0, state="hidden")
+            self.canvas.tag_lower(item, self.ovals[0] if self.ovals else self.hud_floor)
+            self.items.append(item)
+            self.item_state.append([None, None, None, False])
+        return self.items[index]
+
+    def oval(self, index):
+        while index >= len(self.ovals):
+            oval = self.canvas.create_oval(0, 0, 0, 0, fill="#CCFFFF")
+            self.canvas.tag_lower(oval, self.hud_floor)
+            self.ovals.append(oval)
+        return self.ovals[index]
+
+    def draw(self, records):
+        renderer = self.renderer
+        index = 0
+        ovals = 0
+        for kind, frame, angle, x, y in records:
+            if kind == BOMB:
+                oval = self.oval(ovals)
+                self.canvas.coords(oval, x - angle, y - angle, x + angle, y + angle)
+                self.canvas.itemconfigure(oval, state="normal")
+                ovals += 1
+                continue
+
+            item = self.item(index)
+            state = self.item_state[index]
+            image = self.image_for(kind, frame, angle)
+            if state[0] != x or state[1] != y:
+                state[0] = x
+                state[1] = y
+                renderer.move(item, x, y)
+            if state[2] is not image:
+                state[2] = image
+                renderer.configure(item, image=image)
+            if not state[3]:
+                state[3] = True
+                renderer.configure(item, state="normal")
+            index += 1
+
+        for hidden in range(index, self.record_count):
+            self.item_state[hidden][3] = False
+            renderer.configure(self.items[hidden], state="hidden")
+        for oval in self.ovals[ovals:]:
+            self.canvas.itemconfigure(oval, state="hidden")
+        self.record_count = index
+
+    def pre_update(self):
+        snapshot = self.reader.read()
+        if snapshot is None:
+            return
+        seq, header, records = snapshot
+        if seq == self.last_seq:
+            return
+        self.last_seq = seq
+
+        tick, score, health, bomb_power, level, stopped, count = header
+        self.score.value = score
+        self.health.value = health
+        self.bomb_power.value = bomb_power
+        self.level.value = level
+        self.draw(records)
+
+    def perf_counts(self):
+        return {'records': self.record_count}
+
+
+def run_split(seed):
+    import tkinter as tk
+
+    shm = shared_memory.SharedMemory(create=True, size=SHM_SIZE)
+    shm.buf[:SHM_HEADER_SIZE] = bytes(SHM_HEADER_SIZE)
+    context = multiprocessing.get_context('spawn')
+    input_queue = context.Queue()
+    stop_event = context.Event()
+    worker = context.Process(
+        target=run_worker, args=(shm.name, input_queue, stop_event, seed), daemon=True)
+    worker.start()
+
+    try:
+        root = tk.Tk()
+        root.title("Space Fighter")
+        root.resizable(False, False)
+        app = SnapshotView(root, SnapshotReader(shm.buf), input_queue)
+        app.start()
+        root.mainloop()
+    finally:
+        stop_event.set()
+        worker.join(timeout=2)
+        if worker.is_alive():
+            worker.terminate()
+        shm.close()
+        shm.unlink()
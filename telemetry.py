@@ -0,0 +1,148 @@
+import json
+import os
+import struct
+import threading
+import time
+from array import array
+
+from consts import (TELEMETRY_CAPACITY, TELEMETRY_FLUSH_INTERVAL, TELEMETRY_MAX_BYTES,
+                    TELEMETRY_BACKUPS)
+
+(EVENT_FRAME, EVENT_SPAWN, EVENT_KILL, EVENT_BOMB, EVENT_SHIP_HIT, EVENT_BOSS_FIRE,
+ EVENT_DROPPED) = range(7)
+
+# event name and the names of its two values
+EVENTS = (
+    ('frame', 'ms', 'load_stage'),
+    ('spawn', 'strategy', 'count'),
+    ('kill', 'tie_fighter', 'score'),
+    ('bomb', 'kills', 'score'),
+    ('ship_hit', 'health', 'fatal'),
+    ('boss_fire', 'angle', 'bullets'),
+    ('dropped', 'count', 'capacity'),
+)
+
+# event, tick, time, a, b
+RECORD = struct.Struct('<BIddd')
+
+
+class Telemetry:
+    def __init__(self, capacity=TELEMETRY_CAPACITY):
+        # a power of two, so a slot is a mask away from the running counter
+        self.capacity = 1 << (capacity - 1).bit_length()
+        self.mask = self.capacity - 1
+        self.events = array('B', bytes(self.capacity))
+        self.ticks = array('I', [0]) * self.capacity
+        self.times = array('d', [0.0]) * self.capacity
+        self.a = array('d', [0.0]) * self.capacity
+        self.b = array('d', [0.0]) * self.capacity
+        self.head = 0
+        self.tail = 0
+        self.dropped = 0
+        self.reported_dropped = 0
+        self.written = 0
+        self.enabled = False
+        self.start_time = time.perf_counter()
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.file = None
+
+    def record(self, event, tick, a=0.0, b=0.0):
+        if not self.enabled:
+            return
+        head = self.head
+        if head - self.tail >= self.capacity:
+            self.dropped += 1
+            return
+        slot = head & self.mask
+        self.events[slot] = event
+        self.ticks[slot] = tick
+        self.times[slot] = time.perf_counter() - self.start_time
+        self.a[slot] = a
+        self.b[slot] = b
+        self.head = head + 1
+
+    def open(self, directory, prefix='telemetry', binary=False,
+             max_bytes=TELEMETRY_MAX_BYTES, backups=TELEMETRY_BACKUPS,
+             flush_interval=TELEMETRY_FLUSH_INTERVAL):
+        os.makedirs(directory, exist_ok=True)
+        self.binary = binary
+        self.path = os.path.join(directory, prefix + ('.bin' if binary else '.ndjson'))
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.flush_interval = flush_interval
+        self.file = open(self.path, 'ab' if binary else 'a')
+        self.start_time = time.perf_counter()
+        self.stop_event.clear()
+        self.enabled = True
+        self.thread = threading.Thread(target=self.run, name='telemetry', daemon=True)
+        self.thread.start()
+
+    def close(self):
+        if self.thread is None:
+            return
+        self.enabled = False
+        self.stop_event.set()
+        self.thread.join()
+        self.thread = None
+        self.file.close()
+        self.file = None
+
+    def run(self):
+        while not self.stop_event.wait(self.flush_interval):
+            self.flush()
+        self.flush()
+
+    def flush(self):
+        head = self.head
+        tail = self.tail
+        if head == tail and self.dropped == self.reported_dropped:
+            return
+
+        chunks = []
+        for seq in range(tail, head):
+            slot = seq & self.mask
+            chunks.append(self.encode(self.events[slot], self.ticks[slot], self.times[slot],
+                                      self.a[slot], self.b[slot]))
+        # free the slots before the slow part, so the game can refill them
+        self.tail = head
+        self.written += head - tail
+
+        dropped = self.dropped
+        if dropped != self.reported_dropped:
+            chunks.append(self.encode(EVENT_DROPPED, 0, time.perf_counter() - self.start_time,
+                                      dropped, self.capacity))
+            self.reported_dropped = dropped
+
+        self.file.write((b'' if self.binary else '').join(chunks))
+        self.file.flush()
+        if self.file.tell() >= self.max_bytes:
+            self.rotate()
+
+    def encode(self, event, tick, t, a, b):
+        if self.binary:
+            return RECORD.pack(event, tick, t, a, b)
+        name, a_name, b_name = EVENTS[event]
+        return json.dumps({'event': name, 'tick': tick, 't': round(t, 6),
+                           a_name: plain(a), b_name: plain(b)}) + '\n'
+
+    def rotate(self):
+        self.file.close()
+        for index in range(self.backups - 1, 0, -1):
+            source = '%s.%d' % (self.path, index)
+            if os.path.exists(source):
+                os.replace(source, '%s.%d' % (self.path, index + 1))
+        if self.backups > 0:
+            os.replace(self.path, self.path + '.1')
+        else:
+            os.remove(self.path)
+        self.file = open(self.path, 'ab' if self.binary else 'a')
+
+    def pending(self):
+        return self.head - self.tail
+
+
+def plain(value):
+    if value == int(value):
+        return int(value)
+    return round(value, 3)
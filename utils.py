@@ -1,8 +1,15 @@
 import math
-from random import randint
+import random
 
 from consts import *
 
+rng = random.Random()
+
+
+def seed_rng(seed):
+    rng.seed(seed)
+
+
 def direction_to_dxdy(direction):
     return (math.cos(direction * math.pi / 180), 
         math.sin(direction * math.pi / 180))
@@ -16,6 +23,28 @@ def distance(x1, y1, x2, y2):
     return vector_len(x1 - x2, y1 - y2)
 
 
+def distance_sq(x1, y1, x2, y2):
+    dx = x1 - x2
+    dy = y1 - y2
+    return dx*dx + dy*dy
+
+
+def segment_within(x0, y0, x1, y1, r):
+    # closest approach of the segment (x0, y0)-(x1, y1) to the origin
+    dx = x1 - x0
+    dy = y1 - y0
+    l2 = dx*dx + dy*dy
+    if l2 > 0:
+        t = -(x0*dx + y0*dy) / l2
+        if t < 0:
+            t = 0
+        elif t > 1:
+            t = 1
+        x0 += t * dx
+        y0 += t * dy
+    return x0*x0 + y0*y0 <= r*r
+
+
 def normalize_vector(dx, dy):
     l = vector_len(dx, dy)
     if l > 0.01:
@@ -25,7 +54,7 @@ def normalize_vector(dx, dy):
 
 
 def random_edge_position():
-    l = randint(0, CANVAS_HEIGHT * 2 + CANVAS_WIDTH * 2)
+    l = rng.randint(0, CANVAS_HEIGHT * 2 + CANVAS_WIDTH * 2)
     if l > CANVAS_WIDTH * 2 + CANVAS_HEIGHT:
         x = 0
         y = l - CANVAS_WIDTH * 2 + CANVAS_HEIGHT
@@ -0,0 +1,390 @@
+import argparse
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from consts import *
+from entitystore import segment_mask
+
+ENEMY, TIE_FIGHTER, TIE_BULLET = range(3)
+ACTION_MASK = KEY_LEFT | KEY_RIGHT | KEY_FIRE | KEY_TURBO | KEY_BOMB
+
+
+class VecSpaceGame:
+    def __init__(self, num_games, seed=None, enemy_slots=VEC_ENEMY_SLOTS,
+                 max_ticks=None, autoreset=True):
+        if np is None:
+            raise RuntimeError("VecSpaceGame requires numpy")
+
+        self.num_games = num_games
+        self.enemy_slots = enemy_slots
+        self.bullet_slots = MAX_NUM_BULLETS
+        self.max_ticks = max_ticks
+        self.autoreset = autoreset
+        self.rng = np.random.default_rng(seed)
+
+        star = np.radians(np.arange(18) * 20)
+        self.star_vx = np.cos(star) * ENEMY_BASE_SPEED
+        self.star_vy = np.sin(star) * ENEMY_BASE_SPEED
+
+        n, e, b = num_games, enemy_slots, self.bullet_slots
+        self.tick = np.zeros(n, dtype=np.int64)
+        self.score = np.zeros(n, dtype=np.int64)
+        self.health = np.zeros(n, dtype=np.int64)
+        self.bomb_power = np.zeros(n, dtype=np.int64)
+        self.bomb_wait = np.zeros(n, dtype=np.int64)
+        self.turbo_clock = np.zeros(n, dtype=np.int64)
+        self.next_fire_tick = np.zeros(n, dtype=np.int64)
+        self.prev_action = np.zeros(n, dtype=np.int64)
+        self.level = np.zeros(n, dtype=np.int64)
+        self.probs = np.zeros((n, len(ENEMY_STRATEGY_PROBS)))
+        self.done = np.zeros(n, dtype=bool)
+        self.final_score = np.zeros(n, dtype=np.int64)
+        self.final_tick = np.zeros(n, dtype=np.int64)
+
+        self.ship_x = np.zeros(n)
+        self.ship_y = np.zeros(n)
+        self.ship_px = np.zeros(n)
+        self.ship_py = np.zeros(n)
+        self.direction = np.zeros(n)
+        self.turbo = np.zeros(n, dtype=bool)
+        self.turning_left = np.zeros(n, dtype=bool)
+        self.turning_right = np.zeros(n, dtype=bool)
+
+        self.enemy_alive = np.zeros((n, e), dtype=bool)
+        self.enemy_kind = np.zeros((n, e), dtype=np.int8)
+        self.enemy_age = np.zeros((n, e), dtype=np.int64)
+        self.enemy_x = np.zeros((n, e))
+        self.enemy_y = np.zeros((n, e))
+        self.enemy_px = np.zeros((n, e))
+        self.enemy_py = np.zeros((n, e))
+        self.enemy_vx = np.zeros((n, e))
+        self.enemy_vy = np.zeros((n, e))
+
+        self.bullet_alive = np.zeros((n, b), dtype=bool)
+        self.bullet_x = np.zeros((n, b))
+        self.bullet_y = np.zeros((n, b))
+        self.bullet_px = np.zeros((n, b))
+        self.bullet_py = np.zeros((n, b))
+        self.bullet_vx = np.zeros((n, b))
+        self.bullet_vy = np.zeros((n, b))
+
+        self.reset()
+
+    def reset(self, games=None):
+        if games is None:
+            games = np.ones(self.num_games, dtype=bool)
+        self.tick[games] = 0
+        self.score[games] = 0
+        self.health[games] = 4
+        self.bomb_power[games] = BOMB_FULL_POWER
+        self.bomb_wait[games] = 0
+        self.turbo_clock[games] = 0
+        self.next_fire_tick[games] = 0
+        self.prev_action[games] = 0
+        self.level[games] = 1
+        self.probs[games] = ENEMY_STRATEGY_PROBS
+        self.done[games] = False
+
+        self.ship_x[games] = self.ship_px[games] = CANVAS_WIDTH // 2
+        self.ship_y[games] = self.ship_py[games] = CANVAS_HEIGHT // 2
+        self.direction[games] = 0
+        self.turbo[games] = False
+        self.turning_left[games] = False
+        self.turning_right[games] = False
+
+        self.enemy_alive[games] = False
+        self.bullet_alive[games] = False
+        return self.observe()
+
+    def step(self, actions):
+        actions = np.asarray(actions, dtype=np.int64) & ACTION_MASK
+        active = ~self.done
+        score_before = self.score.copy()
+
+        self.tick[active] += 1
+        self.run_timers(active)
+        self.apply_input(actions, active)
+        self.spawn_enemies(active)
+        self.move_ship(active)
+        self.collide_bullets(active)
+        self.level_stage(active)
+        self.move_projectiles(active)
+        died = self.collide_ship(active)
+        self.update_counters(active)
+
+        finished = died
+        if self.max_ticks is not None:
+            finished = finished | (active & (self.tick >= self.max_ticks))
+        rewards = self.score - score_before
+        self.done |= finished
+        self.final_score[finished] = self.score[finished]
+        self.final_tick[finished] = self.tick[finished]
+        if self.autoreset and finished.any():
+            self.reset(finished)
+        return self.observe(), rewards, finished
+
+    def observe(self):
+        return {
+            'ship': np.stack([self.ship_x, self.ship_y, self.direction % 360, self.turbo,
+                              self.bomb_power, self.health], axis=1),
+            'enemies': np.stack([self.enemy_alive, self.enemy_kind, self.enemy_x,
+                                 self.enemy_y, self.enemy_vx, self.enemy_vy], axis=2),
+            'bullets': np.stack([self.bullet_alive, self.bullet_x, self.bullet_y,
+                                 self.bullet_vx, self.bullet_vy], axis=2),
+            'score': self.score.copy(),
+            'tick': self.tick.copy(),
+        }
+
+    def run_timers(self, active):
+        # SpaceGame.turbo_power, every TURBO_DRAIN_INTERVAL ms of game time
+        self.turbo_clock[active] += UPDATE_DELAY
+        due = active & (self.turbo_clock >= TURBO_DRAIN_INTERVAL)
+        self.turbo_clock[due] -= TURBO_DRAIN_INTERVAL
+        self.turbo[due & (self.bomb_power < 10)] = False
+        self.bomb_power[due & self.turbo & (self.bomb_power > 0)] -= 1
+
+        # TieFighter.fire timers, counted from each fighter's spawn
+        live = self.enemy_alive & active[:, None]
+        age = self.enemy_age
+        age[live] += UPDATE_DELAY
+        fire = np.zeros_like(live)
+        for delay in TIE_FIRE_DELAYS:
+            fire |= (age >= delay) & (age - UPDATE_DELAY < delay)
+        fire &= live & (self.enemy_kind == TIE_FIGHTER)
+        fire &= (self.bullet_alive.sum(axis=1) < MAX_NUM_BULLETS)[:, None]
+        games, slots = np.nonzero(fire)
+        if len(games):
+            vx, vy = normalize(self.enemy_vx[games, slots], self.enemy_vy[games, slots])
+            self.add_enemies(games, TIE_BULLET,
+                             self.enemy_x[games, slots], self.enemy_y[games, slots],
+                             vx * BULLET_BASE_SPEED, vy * BULLET_BASE_SPEED)
+
+    def apply_input(self, actions, active):
+        prev = self.prev_action
+        pressed = np.where(active, actions & ~prev, 0)
+        released = np.where(active, prev & ~actions, 0)
+        self.prev_action = np.where(active, actions, prev)
+
+        self.turbo[(pressed & KEY_TURBO) != 0] = True
+        self.turbo[((released & KEY_TURBO) != 0) & ((pressed & KEY_TURBO) == 0)] = False
+        left = (pressed & KEY_LEFT) != 0
+        right = ((pressed & KEY_RIGHT) != 0) & ~left
+        self.turning_left[left] = True
+        self.turning_right[left] = False
+        self.turning_right[right] = True
+        self.turning_left[right] = False
+        self.turning_left[(released & KEY_LEFT) != 0] = False
+        self.turning_right[(released & KEY_RIGHT) != 0] = False
+
+        fire = active & ((actions & KEY_FIRE) != 0) & (self.tick >= self.next_fire_tick)
+        self.next_fire_tick[fire] = self.tick[fire] + FIRE_COOLDOWN_TICKS
+        fire &= self.bullet_alive.sum(axis=1) < MAX_NUM_BULLETS
+        fire &= self.bomb_power > 0
+        games = np.nonzero(fire)[0]
+        if len(games):
+            self.bomb_power[games] -= 1
+            slots = np.argmin(self.bullet_alive[games], axis=1)
+            radians = np.radians(self.direction[games])
+            self.bullet_alive[games, slots] = True
+            self.bullet_x[games, slots] = self.bullet_px[games, slots] = self.ship_x[games]
+            self.bullet_y[games, slots] = self.bullet_py[games, slots] = self.ship_y[games]
+            self.bullet_vx[games, slots] = np.cos(radians) * BULLET_BASE_SPEED
+            self.bullet_vy[games, slots] = np.sin(radians) * BULLET_BASE_SPEED
+
+        bomb = ((pressed & KEY_BOMB) != 0) & (self.bomb_power == BOMB_FULL_POWER)
+        if bomb.any():
+            self.bomb_power[bomb] = 0
+            dx = self.enemy_x - self.ship_x[:, None]
+            dy = self.enemy_y - self.ship_y[:, None]
+            hit = self.enemy_alive & bomb[:, None] & (dx*dx + dy*dy <= BOMB_RADIUS * BOMB_RADIUS)
+            self.score += hit.sum(axis=1)
+            self.enemy_alive &= ~hit
+
+    def spawn_enemies(self, active):
+        n = self.num_games
+        spawn = active & (self.rng.random(n) < ENEMY_SPAWN_CHANCE)
+        p = self.rng.random(n)
+        tie, star, edge = (spawn & (p < self.probs[:, i]) for i in range(3))
+
+        self.spawn_from_edge(np.nonzero(tie)[0], TIE_FIGHTER)
+
+        games = np.nonzero(star)[0]
+        if len(games):
+            x = self.rng.integers(100, CANVAS_WIDTH - 100, len(games), endpoint=True)
+            y = self.rng.integers(100, CANVAS_HEIGHT - 100, len(games), endpoint=True)
+            while True:
+                dx = x - self.ship_x[games]
+                dy = y - self.ship_y[games]
+                close = dx*dx + dy*dy < 200 * 200
+                if not close.any():
+                    break
+                count = close.sum()
+                x[close] = self.rng.integers(100, CANVAS_WIDTH - 100, count, endpoint=True)
+                y[close] = self.rng.integers(100, CANVAS_HEIGHT - 100, count, endpoint=True)
+            burst = len(self.star_vx)
+            self.add_enemies(np.repeat(games, burst), ENEMY,
+                             np.repeat(x, burst), np.repeat(y, burst),
+                             np.tile(self.star_vx, len(games)),
+                             np.tile(self.star_vy, len(games)))
+
+        self.spawn_from_edge(np.nonzero(edge)[0], ENEMY)
+
+    def spawn_from_edge(self, games, kind):
+        if not len(games):
+            return
+        x, y = self.random_edge_position(len(games))
+        vx, vy = normalize(self.ship_x[games] - x, self.ship_y[games] - y)
+        self.add_enemies(games, kind, x, y, vx * ENEMY_BASE_SPEED, vy * ENEMY_BASE_SPEED)
+
+    def random_edge_position(self, count):
+        # mirrors utils.random_edge_position, including its side offsets
+        w, h = CANVAS_WIDTH, CANVAS_HEIGHT
+        l = self.rng.integers(0, h * 2 + w * 2, count, endpoint=True)
+        left = l > w * 2 + h
+        bottom = ~left & (l > w + h)
+        right = ~left & ~bottom & (l > w)
+        x = np.where(left, 0, np.where(bottom, l - w + h, np.where(right, w, l)))
+        y = np.where(left, l - w * 2 + h, np.where(bottom, h, np.where(right, l - w, 0)))
+        return x.astype(float), y.astype(float)
+
+    def add_enemies(self, games, kind, x, y, vx, vy):
+        # rank each new enemy within its game and hand out that game's free
+        # slots in order; spawns beyond a full game's slots are dropped
+        order = np.argsort(games, kind='stable')
+        games = games[order]
+        unique, first, inverse = np.unique(games, return_index=True, return_inverse=True)
+        rank = np.arange(len(games)) - first[inverse]
+        free = ~self.enemy_alive[unique]
+        keep = rank < free.sum(axis=1)[inverse]
+        free_slots = np.argsort(~free, axis=1, kind='stable')
+        slots = free_slots[inverse, np.minimum(rank, self.enemy_slots - 1)]
+
+        games = games[keep]
+        slots = slots[keep]
+        take = order[keep]
+        self.enemy_alive[games, slots] = True
+        self.enemy_kind[games, slots] = kind
+        self.enemy_age[games, slots] = 0
+        self.enemy_x[games, slots] = self.enemy_px[games, slots] = np.broadcast_to(x, order.shape)[take]
+        self.enemy_y[games, slots] = self.enemy_py[games, slots] = np.broadcast_to(y, order.shape)[take]
+        self.enemy_vx[games, slots] = np.broadcast_to(vx, order.shape)[take]
+        self.enemy_vy[games, slots] = np.broadcast_to(vy, order.shape)[take]
+
+    def move_ship(self, active):
+        self.ship_px[active] = self.ship_x[active]
+        self.ship_py[active] = self.ship_y[active]
+        radians = np.radians(self.direction)
+        speed = np.where(self.turbo, SHIP_SPEED * 2, SHIP_SPEED) * active
+        self.ship_x += np.cos(radians) * speed
+        self.ship_y += np.sin(radians) * speed
+
+        turning = active & ~self.turbo
+        self.direction[turning & self.turning_left] -= SHIP_TURN_ANGLE
+        self.direction[turning & ~self.turning_left & self.turning_right] += SHIP_TURN_ANGLE
+
+    def live_columns(self, active):
+        # new enemies take the lowest free slot, so live ones stay packed
+        # into the first columns; only those need testing
+        enemies = self.enemy_alive & active[:, None]
+        cols = np.nonzero(enemies.any(axis=0))[0]
+        return enemies[:, cols], cols
+
+    def collide_bullets(self, active):
+        enemies, cols = self.live_columns(active)
+        bullets = self.bullet_alive & active[:, None]
+        rows = np.nonzero(bullets.any(axis=1))[0]
+        if not len(cols) or not len(rows):
+            return
+        epx = self.enemy_px[rows[:, None], cols]
+        epy = self.enemy_py[rows[:, None], cols]
+        x0 = self.bullet_px[rows, :, None] - epx[:, None, :]
+        y0 = self.bullet_py[rows, :, None] - epy[:, None, :]
+        x1 = self.bullet_x[rows, :, None] - self.enemy_x[rows[:, None], cols][:, None, :]
+        y1 = self.bullet_y[rows, :, None] - self.enemy_y[rows[:, None], cols][:, None, :]
+        hits = segment_mask(x0, y0, x1 - x0, y1 - y0, BULLET_ENEMY_HIT_RADIUS)
+        hits &= bullets[rows, :, None] & enemies[rows, None, :]
+        self.score[rows] += hits.sum(axis=(1, 2))
+        self.bullet_alive[rows] &= ~hits.any(axis=2)
+        self.enemy_alive[rows[:, None], cols] &= ~hits.any(axis=1)
+
+    def collide_ship(self, active):
+        # like SpaceGame, after the enemies moved, so the ship and enemy
+        # paths both cover this tick
+        died = np.zeros(self.num_games, dtype=bool)
+        enemies, cols = self.live_columns(active)
+        if not len(cols):
+            return died
+        x0 = self.ship_px[:, None] - self.enemy_px[:, cols]
+        y0 = self.ship_py[:, None] - self.enemy_py[:, cols]
+        x1 = self.ship_x[:, None] - self.enemy_x[:, cols]
+        y1 = self.ship_y[:, None] - self.enemy_y[:, cols]
+        hits = segment_mask(x0, y0, x1 - x0, y1 - y0, SHIP_ENEMY_HIT_RADIUS) & enemies
+        self.health -= hits.sum(axis=1)
+        died = active & (hits.any(axis=1) & (self.health <= 0) |
+                         (hits & (self.enemy_kind[:, cols] == TIE_FIGHTER)).any(axis=1))
+        self.health[died] = 0
+        self.enemy_alive[:, cols] &= ~hits
+        return died
+
+    def level_stage(self, active):
+        matched = ~active
+        for threshold, level, probs in LEVELS:
+            games = ~matched & (self.score >= threshold)
+            matched |= games
+            self.level[games] = level
+            for index, prob in probs.items():
+                self.probs[games, index] = prob
+
+    def move_projectiles(self, active):
+        for prefix in ('enemy', 'bullet'):
+            alive = getattr(self, prefix + '_alive')
+            x = getattr(self, prefix + '_x')
+            y = getattr(self, prefix + '_y')
+            live = alive & active[:, None]
+            getattr(self, prefix + '_px')[live] = x[live]
+            getattr(self, prefix + '_py')[live] = y[live]
+            x += getattr(self, prefix + '_vx') * live
+            y += getattr(self, prefix + '_vy') * live
+            alive &= ~(live & ((x < 0) | (y < 0) | (x > CANVAS_WIDTH) | (y > CANVAS_HEIGHT)))
+
+    def update_counters(self, active):
+        self.score[active & (self.tick % SCORE_WAIT == 0)] += 1
+        self.bomb_wait[active] += 1
+        due = active & (self.bomb_wait >= BOMB_WAIT) & (self.bomb_power != BOMB_FULL_POWER)
+        self.bomb_wait[due] = 0
+        self.bomb_power[due] += 1
+
+
+def normalize(dx, dy):
+    length = np.sqrt(dx*dx + dy*dy)
+    ok = length > 0.01
+    scale = np.where(ok, 1 / np.where(ok, length, 1), 0)
+    return dx * scale, dy * scale
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Step many games at once with random actions")
+    parser.add_argument('--games', type=int, default=1024)
+    parser.add_argument('--steps', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    env = VecSpaceGame(args.games, seed=args.seed)
+    rng = np.random.default_rng(args.seed)
+    finished = 0
+    start = time.perf_counter()
+    for _ in range(args.steps):
+        actions = rng.integers(0, ACTION_MASK + 1, args.games)
+        obs, rewards, dones = env.step(actions)
+        finished += dones.sum()
+    elapsed = time.perf_counter() - start
+    print("%d games x %d steps in %.2fs: %.0f game steps/s, %d episodes finished" % (
+        args.games, args.steps, elapsed, args.games * args.steps / elapsed, finished))
+
+
+if __name__ == "__main__":
+    main()